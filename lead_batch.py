@@ -0,0 +1,171 @@
+"""Run the lead pipeline without Streamlit and write the view tables.
+
+    python lead_batch.py --leads exports/ --sales sales.xlsx \\
+        --dispo dispo/ --invoices invoices/ --out results/ --format parquet
+
+Directories are expanded to the files with the matching extension. One
+table per view (Campaign, Vendor, Agent, ZIP) is written to ``--out``, or
+one sheet per view for xlsx.
+"""
+import argparse
+import glob
+import hashlib
+import io
+import os
+import sys
+
+import pandas as pd
+
+from lead_invoices import extract_invoice_spend, invoice_spend
+from lead_pipeline import (
+    ENGINE,
+    ENGINES,
+    VIEWS,
+    DispoIndex,
+    PeriodRanges,
+    allocate_cost,
+    build_dataset,
+    month_key,
+    parse_lead_files,
+    parse_sales_file,
+    set_spend,
+    total_spend,
+    view_table,
+)
+
+OUTPUT_FORMATS = ("parquet", "csv", "xlsx")
+
+def expand(paths, exts):
+    """Paths with directories replaced by their files ending in ``exts``."""
+    out = []
+    for path in paths or []:
+        if os.path.isdir(path):
+            out += sorted(
+                p
+                for p in glob.glob(os.path.join(path, "*"))
+                if p.lower().endswith(exts)
+            )
+        else:
+            out.append(path)
+    return out
+
+def open_upload(path):
+    """File-like object with the ``name`` / ``getvalue`` of an upload."""
+    with open(path, "rb") as fh:
+        f = io.BytesIO(fh.read())
+    f.name = os.path.basename(path)
+    return f
+
+def run_pipeline(
+    lead_paths,
+    sales_path=None,
+    dispo_paths=(),
+    invoice_paths=(),
+    manual_spend=0.0,
+    month=None,
+    distinct_mode="Auto",
+    fuzzy_names=False,
+    workers=None,
+    cache_dir=None,
+    engine=None,
+):
+    """Return ({view: table}, {file name: parse error})."""
+    results = parse_lead_files(
+        [open_upload(p) for p in lead_paths], workers, engine=engine
+    )
+    errors = {name: err for name, _, err in results if err}
+    frames = [df for _, df, _ in results if df is not None]
+    if not frames:
+        raise ValueError("no valid leads found")
+    sales = None
+    if sales_path:
+        sales = parse_sales_file(open_upload(sales_path), cache_dir)
+    dispo_index = DispoIndex()
+    for path in dispo_paths:
+        with open(path, "rb") as fh:
+            dispo_index.apply(path, hashlib.sha256(fh.read()).hexdigest())
+    leads = pd.concat(frames, ignore_index=True)
+    leads, _, cube, sketches, _ = build_dataset(
+        leads, sales, dispo_index, distinct_mode, fuzzy_names, engine=engine
+    )
+    spend = None
+    if manual_spend:
+        spend = total_spend("SmartFinancial", manual_spend)
+    elif invoice_paths:
+        spend = invoice_spend(extract_invoice_spend(invoice_paths, cache_dir))
+    leads["cost"] = allocate_cost(leads, spend)
+    set_spend(cube, leads)
+    if month:
+        key = month_key(month)
+        cube = cube.iloc[PeriodRanges(cube["Month"]).rows(key, key)]
+    # Without sales there is no agent column, so no Agent view.
+    tables = {
+        view: view_table(cube, sketches, view)
+        for view, (by, _, _) in VIEWS.items()
+        if set(by) <= set(cube.columns)
+    }
+    return tables, errors
+
+def write_tables(tables, out_dir, fmt="parquet"):
+    """Write each view table to ``out_dir``; returns the paths written."""
+    os.makedirs(out_dir, exist_ok=True)
+    if fmt == "xlsx":
+        path = os.path.join(out_dir, "lead_views.xlsx")
+        with pd.ExcelWriter(path) as writer:
+            for view, table in tables.items():
+                table.to_excel(writer, sheet_name=view, index=False)
+        return [path]
+    paths = []
+    for view, table in tables.items():
+        path = os.path.join(out_dir, f"{view.lower()}.{fmt}")
+        if fmt == "csv":
+            table.to_csv(path, index=False)
+        else:
+            table.to_parquet(path, index=False)
+        paths.append(path)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--leads", nargs="+", required=True)
+    parser.add_argument("--sales")
+    parser.add_argument("--dispo", nargs="*", default=[])
+    parser.add_argument("--invoices", nargs="*", default=[])
+    parser.add_argument("--manual-spend", type=float, default=0.0)
+    parser.add_argument("--month", help="YYYY-MM; all months if omitted")
+    parser.add_argument(
+        "--distinct", choices=["Auto", "Exact", "HyperLogLog"], default="Auto"
+    )
+    parser.add_argument("--fuzzy-names", action="store_true")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--engine", choices=ENGINES, default=ENGINE)
+    parser.add_argument("--cache-dir", default=".lead_cache")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="parquet")
+    args = parser.parse_args(argv)
+
+    try:
+        tables, errors = run_pipeline(
+            expand(args.leads, (".csv",)),
+            args.sales,
+            expand(args.dispo, (".csv",)),
+            expand(args.invoices, (".pdf",)),
+            args.manual_spend,
+            args.month,
+            args.distinct,
+            args.fuzzy_names,
+            args.workers,
+            args.cache_dir,
+            args.engine,
+        )
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    for name, err in errors.items():
+        print(f"skipped {name}: {err}", file=sys.stderr)
+    for path in write_tables(tables, args.out, args.format):
+        print(path)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
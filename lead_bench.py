@@ -0,0 +1,273 @@
+"""Time and memory-profile each pipeline stage on synthetic data.
+
+    python lead_bench.py --rows 1000000 --out bench_results/
+    python lead_bench.py --rows 1000000 --compare bench_results/old.json
+    python lead_bench.py --rows 100000 --engine polars
+    python lead_bench.py --rows 1000000 --kernels
+
+The data set is generated once per rows/seed under --data. Stage timings are
+the best of --repeat runs; peak memory comes from one extra run under
+tracemalloc with parsing kept in-process so its allocations are seen
+(Arrow-backed string buffers are allocated outside tracemalloc and are not
+counted). Results are written as JSON for comparing runs.
+
+--kernels instead times the lead_normalize kernels against the pandas
+string code they replaced, on --rows synthetic values. That the engines
+give identical view tables is checked by tests/test_engines.py.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from lead_batch import open_upload
+from lead_normalize import (
+    clean_email,
+    email_key,
+    normalize_name,
+    normalize_phone,
+    normalize_zip,
+)
+from lead_pipeline import (
+    ENGINE,
+    ENGINES,
+    VIEWS,
+    DispoIndex,
+    StageProfile,
+    allocate_cost,
+    build_dataset,
+    parse_lead_files,
+    parse_sales_file,
+    set_spend,
+    total_spend,
+    view_table,
+)
+from lead_synth import format_phone, generate, people
+
+_BLANKS = ["", "nan", "none", "null", "NAN", "NONE", "NULL"]
+
+def _legacy_email(s):
+    return s.astype(str).str.lower().str.strip().mask(lambda e: e.isin(_BLANKS))
+
+def _legacy_phone(s):
+    digits = (
+        s.astype(str)
+        .str.replace(r"\.0$", "", regex=True)
+        .str.replace(r"\D", "", regex=True)
+        .str[-10:]
+    )
+    return digits.where(digits.str.len() == 10)
+
+def _legacy_zip(s):
+    digits = (
+        s.astype(str)
+        .str.replace(r"\.0$", "", regex=True)
+        .str.replace(r"\D", "", regex=True)
+        .str[:5]
+    )
+    return digits.where(digits.str.len() > 0).str.zfill(5)
+
+# name: (input field, the pandas .str code it replaced, kernel). The old
+# email key was the cleaned email; email_key also folds Gmail aliases.
+KERNELS = {
+    "email": ("email", _legacy_email, clean_email),
+    "emailkey": ("email", _legacy_email, email_key),
+    "phone": ("phone", _legacy_phone, normalize_phone),
+    "name": (
+        "name",
+        lambda s: (
+            s.astype(str).str.upper().str.replace(r"\s+", " ", regex=True).str.strip()
+        ).mask(lambda n: n.isin(_BLANKS)),
+        normalize_name,
+    ),
+    "zip": ("zip", _legacy_zip, normalize_zip),
+}
+
+def run_stages(paths, profile, workers=None, engine=None):
+    """Run the dashboard pipeline once on ``paths``, recording each stage.
+
+    Returns the view tables.
+    """
+    with profile.stage("parse leads") as rec:
+        results = parse_lead_files(
+            [open_upload(p) for p in paths["leads"]], workers, engine=engine
+        )
+        frames = [df for _, df, _ in results if df is not None]
+        rec["rows_out"] = sum(len(df) for df in frames)
+    with profile.stage("parse sales") as rec:
+        sales = parse_sales_file(open_upload(paths["sales"]))
+        rec["rows_out"] = len(sales)
+    with profile.stage("dispo index") as rec:
+        dispo_index = DispoIndex()
+        for path in paths["dispo"]:
+            dispo_index.apply(path, path)
+        rec["rows_out"] = sum(map(len, dispo_index.tables.values()))
+    leads = pd.concat(frames, ignore_index=True)
+    leads, _, cube, sketches, _ = build_dataset(
+        leads, sales, dispo_index, profile=profile, engine=engine
+    )
+    with profile.stage("cost allocation", len(leads)) as rec:
+        leads["cost"] = allocate_cost(leads, total_spend("SmartFinancial", 1e5))
+        set_spend(cube, leads)
+        rec["rows_out"] = len(cube)
+    tables = {}
+    for view in VIEWS:
+        with profile.stage(f"view {view}", len(cube)) as rec:
+            tables[view] = view_table(cube, sketches, view)
+            rec["rows_out"] = len(tables[view])
+    return tables
+
+def kernel_inputs(rows, seed=0):
+    """Vendor-formatted text for the KERNELS input fields, as read from a CSV."""
+    rng = np.random.default_rng(seed)
+    p = people(rows, rng)
+    fmts = ["({a}) {b}-{c}", "+1{a}{b}{c}", "{a}-{b}-{c} x12", "{a}{b}{c}"]
+    phone = pd.Series("", index=p.index)
+    pick = rng.integers(len(fmts), size=rows)
+    for i, fmt in enumerate(fmts):
+        phone[pick == i] = format_phone(p["phone"][pick == i], fmt)
+    return {
+        "email": (" " + p["email"].str.title()).astype("str"),
+        "phone": phone.astype("str"),
+        "name": (p["first"] + "  " + p["last"].str.lower()).astype("str"),
+        "zip": p["zip"].astype(str).str.zfill(5).astype("str"),
+    }
+
+def bench_kernels(rows, seed=0, repeat=3):
+    """Best seconds per field for the legacy code and the Arrow kernel."""
+    inputs = kernel_inputs(rows, seed)
+    out = []
+    for name, (field, legacy, kernel) in KERNELS.items():
+        rec = {"kernel": name, "rows": rows}
+        for code, fn in (("legacy", legacy), ("arrow", kernel)):
+            times = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                fn(inputs[field])
+                times.append(time.perf_counter() - t0)
+            rec[f"{code}_seconds"] = min(times)
+        out.append(rec)
+    return out
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        return None
+
+def benchmark(paths, repeat=3, workers=None, memory=True, engine=None):
+    """Per-stage records: best seconds over ``repeat`` runs, peak bytes."""
+    runs = []
+    for _ in range(repeat):
+        profile = StageProfile()
+        run_stages(paths, profile, workers, engine)
+        runs.append(profile.stages)
+    stages = [dict(rec) for rec in runs[0]]
+    for i, rec in enumerate(stages):
+        rec["seconds"] = min(run[i]["seconds"] for run in runs)
+    if memory:
+        profile = StageProfile(memory=True)
+        run_stages(paths, profile, 1, engine)
+        for rec, mem in zip(stages, profile.stages):
+            rec["peak_bytes"] = mem["peak_bytes"]
+    return stages
+
+def compare(stages, baseline):
+    """Print seconds and peak memory against a previous result file."""
+    with open(baseline) as fh:
+        old = {rec["stage"]: rec for rec in json.load(fh)["stages"]}
+    print(f"{'stage':<18}{'old s':>10}{'new s':>10}{'ratio':>8}{'peak MB':>10}")
+    for rec in stages:
+        before = old.get(rec["stage"], {}).get("seconds")
+        ratio = rec["seconds"] / before if before else float("nan")
+        peak = rec.get("peak_bytes", 0) / 2**20
+        print(
+            f"{rec['stage']:<18}{before or float('nan'):>10.3f}"
+            f"{rec['seconds']:>10.3f}{ratio:>8.2f}{peak:>10.1f}"
+        )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", default="bench_data")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--engine", choices=ENGINES, default=ENGINE)
+    parser.add_argument("--kernels", action="store_true")
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--out", default="bench_results")
+    parser.add_argument("--compare", help="earlier result JSON")
+    args = parser.parse_args(argv)
+
+    if args.kernels:
+        print(f"{'kernel':<10}{'legacy rows/s':>16}{'arrow rows/s':>16}{'speedup':>9}")
+        for rec in bench_kernels(args.rows, args.seed, args.repeat):
+            legacy, arrow = rec["legacy_seconds"], rec["arrow_seconds"]
+            print(
+                f"{rec['kernel']:<10}{args.rows / legacy:>16,.0f}"
+                f"{args.rows / arrow:>16,.0f}{legacy / arrow:>9.1f}"
+            )
+        return 0
+
+    data_dir = os.path.join(args.data, f"rows{args.rows}-seed{args.seed}")
+    manifest = os.path.join(data_dir, "paths.json")
+    if not os.path.exists(manifest):
+        # openpyxl writes about 100k rows/s; keep big sales sets in CSV.
+        fmt = "xlsx" if args.rows <= 1_000_000 else "csv"
+        paths = generate(data_dir, args.rows, args.seed, fmt)
+        with open(manifest, "w") as fh:
+            json.dump(paths, fh)
+    with open(manifest) as fh:
+        paths = json.load(fh)
+
+    stages = benchmark(
+        paths, args.repeat, args.workers, not args.no_memory, args.engine
+    )
+    result = {
+        "meta": {
+            "rows": args.rows,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "workers": args.workers,
+            "engine": args.engine,
+            "revision": _git_revision(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "stages": stages,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    out = os.path.join(
+        args.out, f"bench-{args.rows}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    with open(out, "w") as fh:
+        json.dump(result, fh, indent=2)
+    if args.compare:
+        compare(stages, args.compare)
+    else:
+        for rec in stages:
+            print(
+                f"{rec['stage']:<18}{rec['seconds']:>9.3f}s"
+                f"{rec.get('peak_bytes', 0) / 2**20:>9.1f} MB"
+            )
+    print(out)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
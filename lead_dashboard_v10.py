@@ -2,7 +2,58 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import altair as alt
+import glob
+import hashlib
+import os
 import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from importlib.util import find_spec
+
+from lead_invoices import (
+    extract_invoice_spend,
+    invoice_spend,
+    spend_by_date_campaign,
+)
+from lead_pipeline import (
+    ENGINE,
+    ENGINES,
+    NO_DATE,
+    PARSER_VERSION,
+    DRILL_PAGE_ROWS,
+    DRILL_SORTS,
+    VIEWS,
+    ZIP_LEVELS,
+    ZIP_OTHER,
+    ZIP_TOP_N,
+    CellIndex,
+    DatasetCache,
+    PeriodRanges,
+    StageProfile,
+    allocate_cost,
+    build_cube,
+    build_dataset,
+    day_key,
+    day_keys,
+    DispoIndex,
+    drill_page,
+    month_key,
+    month_label,
+    parse_sales_file,
+    profile_stage,
+    rollup,
+    set_spend,
+    sort_rows,
+    submit_lead_files,
+    total_spend,
+    view_cells,
+    view_table,
+    zip_cells,
+    zip_table,
+)
+from lead_sql import EXAMPLE_QUERY, SQL_MAX_ROWS, connect, query, tables
 
 # ── Page Config & CSS Styling ─────────────────────────────────────────────────
 st.set_page_config(page_title="📊 Lead Dashboard V10", layout="wide")
@@ -41,219 +92,535 @@ sales_file = st.sidebar.file_uploader(
     "Sales Data (CSV/Excel)",
     type=["csv", "xlsx"]
 )
-dispo_file = st.sidebar.file_uploader(
-    "Disposition CSV",
-    type="csv"
+dispo_files = st.sidebar.file_uploader(
+    "Disposition CSVs (full or delta exports)",
+    type="csv",
+    accept_multiple_files=True
+)
+invoice_pdfs = st.sidebar.file_uploader(
+    "SmartFinancial Billing PDFs",
+    type="pdf",
+    accept_multiple_files=True
 )
 manual_spend = st.sidebar.number_input(
     "SmartFinancial Total Spend",
     min_value=0.0,
     step=1.0
 )
+LEAD_STORE_DIR = os.environ.get("LEAD_DASHBOARD_STORE", "lead_store")
+parallel_ingest = st.sidebar.checkbox("Parse lead files in parallel", value=True)
+distinct_mode = st.sidebar.selectbox(
+    "Distinct lead counting", ["Auto", "Exact", "HyperLogLog"]
+)
+fuzzy_names = st.sidebar.checkbox("Fuzzy name matching for sales")
+engines = [e for e in ENGINES if e == "pandas" or find_spec(e)]
+engine = st.sidebar.selectbox(
+    "Pipeline engine", engines, index=engines.index(ENGINE) if ENGINE in engines else 0
+)
+use_store = st.sidebar.checkbox(
+    "Use lead history store", value=os.path.isdir(LEAD_STORE_DIR)
+)
+profile_stages = st.sidebar.checkbox(
+    "Profile pipeline stages",
+    value=bool(os.environ.get("LEAD_DASHBOARD_PROFILE")),
+)
 st.sidebar.markdown("---")
+profile = StageProfile(memory=True) if profile_stages else None
+run_started = time.perf_counter()
 
-# ── Parsing Helpers ──────────────────────────────────────────────────────────
-def parse_lead_file(f):
-    basename = f.name.rsplit(".", 1)[0]
-    for sep in ("_", "-", " "):
-        if sep in basename:
-            vendor, campaign = basename.split(sep, 1)
-            break
-    else:
-        return None
-    try:
-        df = pd.read_csv(f)
-    except:
-        return None
-    df.rename(columns=lambda c: c.strip(), inplace=True)
-    # Email
-    email_cols = [c for c in df.columns if "email" in c.lower()]
-    df["email"] = (
-        df[email_cols[0]]
-        .astype(str)
-        .str.lower()
-        .str.strip()
-        if email_cols
-        else None
-    )
-    # Cost
-    df["cost"] = 0.0
-    if vendor.lower() == "eq" and "cost" in df.columns:
-        df["cost"] = pd.to_numeric(df["cost"], errors="coerce").fillna(0)
-        df["cost"] = df["cost"].apply(lambda x: x / 100 if x > 100 else x)
-    if vendor.lower().startswith("smartfinancial") and manual_spend > 0:
-        df["cost"] = manual_spend / len(df) if len(df) > 0 else 0
-    # Names
-    fn = [c for c in df.columns if "first" in c.lower()]
-    ln = [c for c in df.columns if "last" in c.lower()]
-    df["first_name"] = df[fn[0]].astype(str) if fn else None
-    df["last_name"] = df[ln[0]].astype(str) if ln else None
-    # Phone
-    ph = [c for c in df.columns if "phone" in c.lower()]
-    df["Phone"] = (
-        df[ph[0]]
-        .astype(str)
-        .str.replace(r"\D", "", regex=True)
-        .str[-10:]
-        if ph
-        else None
+# ── Parse Cache ───────────────────────────────────────────────────────────────
+PARSE_CACHE_MAX_MB = float(os.environ.get("LEAD_DASHBOARD_CACHE_MB", 512))
+# Converted sales workbooks and invoice line items, keyed by file digest.
+CACHE_DIR = os.environ.get("LEAD_DASHBOARD_CACHE_DIR", ".lead_cache")
+
+class ParseCache:
+    """LRU cache of parsed frames keyed by upload content hash."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def lookup(self, key):
+        with self._lock:
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def cached(self, keys):
+        """{key: frame} for those of ``keys`` in the cache."""
+        with self._lock:
+            return {k: self.lookup(k) for k in keys if k in self}
+
+    def get(self, key, parse, f):
+        with self._lock:
+            if key in self:
+                return self.lookup(key)
+        return self.put(key, parse(f))
+
+    def put(self, key, df):
+        size = 0 if df is None else int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if size <= self.max_bytes and key not in self:
+                self._entries[key] = (df, size)
+                self.nbytes += size
+                self.evict()
+        return df
+
+    def evict(self):
+        with self._lock:
+            while self.nbytes > self.max_bytes and self._entries:
+                _, (_, size) = self._entries.popitem(last=False)
+                self.nbytes -= size
+
+# An upload's file_id stays the same across reruns until it is replaced, so
+# each upload is hashed once.
+digests = st.session_state.setdefault("digests", {})
+
+def file_digest(f):
+    file_id = getattr(f, "file_id", None)
+    if file_id is None:
+        return hashlib.sha256(f.getvalue()).hexdigest()
+    if file_id not in digests:
+        digests[file_id] = hashlib.sha256(f.getvalue()).hexdigest()
+    return digests[file_id]
+
+def cache_key(kind, f):
+    return (kind, PARSER_VERSION, f.name, file_digest(f))
+
+# ── Shared Caches ─────────────────────────────────────────────────────────────
+# Parsed files, background parse jobs and built datasets are kept once per
+# server process and shared by every session, so users opening the same
+# files share one copy. Datasets are leased per session (see DatasetCache):
+# over LEAD_DASHBOARD_SHARED_MB, the least recently used ones no session
+# holds are spilled to the cache directory.
+SHARED_CACHE_MAX_MB = float(os.environ.get("LEAD_DASHBOARD_SHARED_MB", 2048))
+
+@st.cache_resource
+def shared_caches():
+    return (
+        ParseCache(PARSE_CACHE_MAX_MB * 2**20),
+        {},  # upload key -> IngestJob
+        {},  # upload key -> parse error
+        weakref.WeakValueDictionary(),  # upload key -> frame a session pins
+        threading.Lock(),
+        DatasetCache(
+            SHARED_CACHE_MAX_MB * 2**20, os.path.join(CACHE_DIR, "datasets")
+        ),
     )
-    # Created Date
-    dt = [c for c in df.columns if "date" in c.lower()]
-    if dt:
-        df["Created Date"] = pd.to_datetime(df[dt[0]], errors="coerce")
-    # Zip
-    zp = [c for c in df.columns if "zip" in c.lower()]
-    if zp:
-        df["Zip"] = df[zp[0]]
-    # Annotate
-    df["vendor"] = vendor
-    df["campaign"] = campaign
-    cols = [
-        "vendor",
-        "campaign",
-        "email",
-        "first_name",
-        "last_name",
-        "cost",
-        "Phone",
-        "Created Date",
-        "Zip",
-    ]
-    return df[[c for c in cols if c in df.columns]]
 
-def parse_sales_file(f):
-    try:
-        df = (
-            pd.read_excel(f)
-            if f.name.lower().endswith(("xls", "xlsx"))
-            else pd.read_csv(f)
+(
+    parse_cache,
+    ingest,
+    parse_errors,
+    pinned_frames,
+    ingest_lock,
+    dataset_cache,
+) = shared_caches()
+parse_cache.max_bytes = PARSE_CACHE_MAX_MB * 2**20
+parse_cache.evict()
+dataset_cache.max_bytes = SHARED_CACHE_MAX_MB * 2**20
+
+# ── Invoice Spend ─────────────────────────────────────────────────────────────
+# A manual total wins; otherwise SmartFinancial spend comes from the invoice
+# line items, by campaign and date.
+invoice_items = None
+invoice_key = None
+if invoice_pdfs:
+    invoice_key = tuple(file_digest(f) for f in invoice_pdfs)
+    if st.session_state.get("invoice_key") != invoice_key:
+        st.session_state["invoice_items"] = extract_invoice_spend(
+            invoice_pdfs, CACHE_DIR
         )
-    except:
-        return None
-    df.rename(columns=lambda c: c.strip(), inplace=True)
-    # Email
-    em = [c for c in df.columns if "email" in c.lower()]
-    df["email"] = (
-        df[em[0]]
-        .astype(str)
-        .str.lower()
-        .str.strip()
-        if em
-        else None
+        st.session_state["invoice_key"] = invoice_key
+    invoice_items = st.session_state["invoice_items"]
+spend = None
+if manual_spend:
+    spend = total_spend("SmartFinancial", manual_spend)
+elif invoice_items is not None:
+    spend = invoice_spend(invoice_items)
+
+# ── Lead Store ────────────────────────────────────────────────────────────────
+# Parsed leads are appended once to a Parquet dataset partitioned as
+# vendor=<vendor>/month=<YYYY-MM>/<file digest>-<n>.parquet, so history does
+# not have to be re-uploaded and only the selected month is read back.
+STORE_DTYPES = {
+    "vendor": "string",
+    "campaign": "string",
+    "email": "string",
+    "first_name": "string",
+    "last_name": "string",
+    "cost": "float64",
+    "Phone": "string",
+    "Created Date": "datetime64[ns]",
+    "Zip": "string",
+}
+
+def in_store(digest):
+    pattern = os.path.join(LEAD_STORE_DIR, "*", "*", f"{digest}-*.parquet")
+    return bool(glob.glob(pattern))
+
+def append_to_store(df, digest):
+    if df is None or df.empty or in_store(digest):
+        return
+    out = df.reindex(columns=list(STORE_DTYPES))
+    out["Zip"] = out["Zip"].where(out["Zip"].isna(), out["Zip"].astype(str))
+    out = out.astype(STORE_DTYPES)
+    out["month"] = out["Created Date"].dt.to_period("M").astype(str)
+    out.to_parquet(
+        LEAD_STORE_DIR,
+        partition_cols=["vendor", "month"],
+        basename_template=f"{digest}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        index=False,
+    )
+
+def store_months():
+    return sorted(
+        {
+            os.path.basename(p).split("=", 1)[1]
+            for p in glob.glob(os.path.join(LEAD_STORE_DIR, "*", "month=*"))
+        }
     )
-    # Assigned To User
-    au = [c for c in df.columns if "assign" in c.lower()]
-    df["Assigned To User"] = df[au[0]].astype(str) if au else None
-    # Policy/Premium/Items defaults
-    for col in ("Policy #", "Premium", "Items"):
-        if col not in df.columns:
-            df[col] = 0 if col != "Policy #" else ""
-    df["Premium"] = pd.to_numeric(df["Premium"], errors="coerce").fillna(0)
-    df["Items"] = pd.to_numeric(df["Items"], errors="coerce").fillna(0)
-    return df[["email", "Policy #", "Premium", "Items", "Assigned To User"]]
+
+def load_store(months=None):
+    filters = [("month", "in", months)] if months else None
+    # The disposition index is kept next to the partitions; skip its files.
+    df = pd.read_parquet(
+        LEAD_STORE_DIR,
+        filters=filters,
+        ignore_prefixes=[".", "_", "dispositions"],
+    )
+    df["vendor"] = df["vendor"].astype(str)
+    return df.drop(columns="month")[list(STORE_DTYPES)]
+
+def store_fingerprint(months=None):
+    """Partition files load_store reads, with their modification times."""
+    paths = [
+        p
+        for m in (months or ["*"])
+        for p in glob.glob(
+            os.path.join(LEAD_STORE_DIR, "*", f"month={m}", "*.parquet")
+        )
+    ]
+    return tuple(sorted((p, os.path.getmtime(p)) for p in paths))
 
 # ── Load Data ─────────────────────────────────────────────────────────────────
-if not lead_files or not sales_file:
+if not sales_file or not (lead_files or (use_store and store_months())):
     st.warning("Upload lead files and sales data via the sidebar.")
     st.stop()
 
-leads = pd.concat(
-    [
-        d
-        for d in (parse_lead_file(f) for f in lead_files)
-        if d is not None
-    ],
-    ignore_index=True,
-)
-if leads.empty:
+lead_files = lead_files or []
+lead_keys = [cache_key("lead", f) for f in lead_files]
+sales_key = cache_key("sales", sales_file)
+# Lead files are parsed in the background. Jobs are kept by upload key in the
+# shared caches, so a rerun while they run (any widget click), or another
+# session with the same files, picks them up instead of starting over. The
+# views are built from the files finished so far until the last one lands.
+# Finished frames stay pinned in session_state while their upload set is
+# current: the parse cache may evict them before the last file is in, and a
+# file that was parsed once is never submitted again. Other sessions find
+# them in pinned_frames for as long as any session pins them.
+INGEST_POLL_SECONDS = 1.0
+with ingest_lock:
+    frames = parse_cache.cached(lead_keys)
+    pinned = st.session_state.get("lead_frames", {})
+    for k in lead_keys:
+        d = pinned[k] if k in pinned else pinned_frames.get(k)
+        if d is not None or k in pinned:
+            frames[k] = d
+    todo = [
+        (f, k)
+        for f, k in zip(lead_files, lead_keys)
+        if k not in frames and k not in ingest
+    ]
+    if todo:
+        jobs = submit_lead_files(
+            [f for f, _ in todo], None if parallel_ingest else 1, profile, engine
+        )
+        ingest.update(zip([k for _, k in todo], jobs))
+    # Any session collects every finished job, not just its own, so a job
+    # whose session has gone away does not hold its frame in ingest.
+    for k, job in list(ingest.items()):
+        if job.future.done():
+            _, d, err = job.result(profile if k in lead_keys else None)
+            d = parse_cache.put(k, d)
+            if k in lead_keys:
+                frames[k] = d
+            if d is not None:
+                pinned_frames[k] = d
+            parse_errors[k] = err
+            del ingest[k]
+st.session_state["lead_frames"] = frames
+pending = {k for k in lead_keys if k not in frames}
+parsed = [(f, frames[k]) for f, k in zip(lead_files, lead_keys) if k in frames]
+for f, k in zip(lead_files, lead_keys):
+    if k in frames and parse_errors.get(k):
+        st.warning(f"⚠️ File '{f.name}' was skipped: {parse_errors[k]}")
+
+@st.fragment(run_every=INGEST_POLL_SECONDS)
+def ingest_progress():
+    """Per-file status, refreshed on its own; reruns the app as files finish."""
+    jobs = {k: ingest.get(k) for k in pending}
+    if any(job is None or job.future.done() for job in jobs.values()):
+        st.rerun()
+    rows = []
+    for f, k in zip(lead_files, lead_keys):
+        if k in jobs:
+            rows.append((f.name, jobs[k].status, None))
+        elif frames[k] is None:
+            rows.append((f.name, "failed", None))
+        else:
+            rows.append((f.name, "done", len(frames[k])))
+    status = pd.DataFrame(rows, columns=["File", "Status", "Rows"])
+    finished = status["Status"].isin(["done", "failed"])
+    st.progress(
+        finished.mean(),
+        text=f"Parsing lead files: {finished.sum()} of {len(status)} done",
+    )
+    with st.expander("Files"):
+        st.dataframe(status, use_container_width=True, hide_index=True)
+
+if pending:
+    ingest_progress()
+    vendors = sorted(
+        {v for _, d in parsed if d is not None for v in d["vendor"].unique()}
+    )
+    if vendors:
+        st.info(
+            "Partial results from the files parsed so far "
+            f"({', '.join(vendors)}); the views switch to the full data set "
+            "when the rest are done."
+        )
+if use_store:
+    for f, d in parsed:
+        append_to_store(d, file_digest(f))
+    load_month = st.selectbox("Load month", ["All"] + store_months())
+if not any(d is not None for _, d in parsed) and not (
+    use_store and store_months()
+):
+    if pending:
+        st.stop()  # the progress fragment reruns the app when a file is in
     st.error("No valid leads found. Check filenames/formats.")
     st.stop()
 
-if "Milestone" not in leads.columns:
-    leads["Milestone"] = None
-
-# ── Merge Dispositions ─────────────────────────────────────────────────────────
-def merge_dispo(df, path):
-    dispo = pd.read_csv(path)
-    if "Folders" in dispo.columns:
-        dispo = dispo[~dispo["Folders"].astype(str).str.contains("!")]
-    if "Phone" in dispo.columns:
-        dispo["Phone"] = (
-            dispo["Phone"]
-            .astype(str)
-            .str.replace(r"\D", "", regex=True)
-            .str[-10:]
-        )
-        mp = (
-            dispo.dropna(subset=["Phone"])
-            .drop_duplicates("Phone")
-            .set_index("Phone")["Milestone"]
-        )
-        df["Milestone"] = df["Phone"].map(mp).fillna(df["Milestone"])
-    return df
+# ── Dispositions ──────────────────────────────────────────────────────────────
+# With the history store the disposition index persists next to it and keeps
+# every export ever applied; all sessions share one index per store file, so
+# their exports accumulate instead of overwriting each other's saves.
+# Otherwise it is rebuilt from the current uploads.
+@st.cache_resource
+def store_dispo_index(path):
+    return DispoIndex(path)
 
-if dispo_file:
-    leads = merge_dispo(leads, dispo_file)
-    st.success("✅ Dispositions merged.")
+dispo_files = dispo_files or []
+dispo_digests = tuple(file_digest(f) for f in dispo_files)
+if use_store:
+    dispo_index = store_dispo_index(
+        os.path.join(LEAD_STORE_DIR, "dispositions.parquet")
+    )
+else:
+    if st.session_state.get("dispo_digests") != dispo_digests:
+        st.session_state["dispo_index"] = DispoIndex()
+        st.session_state["dispo_digests"] = dispo_digests
+    dispo_index = st.session_state["dispo_index"]
+with profile_stage(profile, "dispo index") as rec:
+    with dispo_index.lock:
+        applied = [
+            dispo_index.apply(f, d) for f, d in zip(dispo_files, dispo_digests)
+        ]
+        if any(applied):
+            dispo_index.save()
+    rec["rows_out"] = sum(map(len, dispo_index.tables.values()))
 
-# ── Merge Sales ─────────────────────────────────────────────────────────────────
-sales = parse_sales_file(sales_file)
-if sales is not None:
-    leads = leads.merge(sales, on="email", how="left")
-    st.success("✅ Sales merged.")
+# ── Sales ─────────────────────────────────────────────────────────────────────
+with profile_stage(profile, "sales") as rec:
+    sales = parse_cache.get(
+        sales_key,
+        lambda f: parse_sales_file(f, CACHE_DIR),
+        sales_file,
+    )
+    rec["rows_out"] = None if sales is None else len(sales)
 
-# ── Flags & Month ─────────────────────────────────────────────────────────────
-leads["is_connected"] = leads["Milestone"].isin(
-    ["Contacted", "Quoted", "Not interested", "Xdate", "Sold"]
+# ── Build Dataset ─────────────────────────────────────────────────────────────
+# Merges, flags, compaction and the metrics cube only rerun when the inputs
+# change, and only once for every session with the same inputs: the dataset
+# is leased from the shared cache and kept in session_state. While files are
+# still parsing, the partial dataset is built for this session alone and
+# kept in session_state only; it never enters the shared cache. Spend is
+# allocated afterwards on the session's own shallow copy, so editing it never
+# rebuilds the dataset or touches another session's.
+dataset_key = (
+    tuple(k for k in lead_keys if k in frames),
+    sales_key,
+    use_store,
+    tuple(dispo_index.applied),
+    load_month if use_store else None,
+    # Other sessions add to the store too; rebuild when its files change.
+    store_fingerprint(None if load_month == "All" else [load_month])
+    if use_store
+    else None,
+    distinct_mode,
+    fuzzy_names,
+    engine,
 )
-leads["is_quoted"] = leads["Milestone"] == "Quoted"
-if "Created Date" in leads.columns:
-    leads["Created Date"] = pd.to_datetime(
-        leads["Created Date"], errors="coerce"
+
+def load_dataset():
+    if use_store:
+        with profile_stage(profile, "load store") as rec:
+            leads = load_store(None if load_month == "All" else [load_month])
+            rec["rows_out"] = len(leads)
+    else:
+        leads = pd.concat(
+            [d for _, d in parsed if d is not None], ignore_index=True
+        )
+    if leads.empty:
+        raise ValueError("No valid leads found. Check filenames/formats.")
+    dataset = build_dataset(
+        leads, sales, dispo_index, distinct_mode, fuzzy_names, profile, engine
     )
-    leads["Month"] = (
-        leads["Created Date"].dt.to_period("M").astype(str)
+    leads, cube = dataset[0], dataset[2]
+    periods = (
+        PeriodRanges(day_keys(leads["Created Date"])),
+        PeriodRanges(cube["Month"]),
     )
+    return dataset, periods, CellIndex(leads["cell"], len(cube))
+
+lease = st.session_state.get("dataset_lease")
+if lease is not None and lease.key == dataset_key:
+    dataset = lease.value
+elif pending:
+    if lease is not None:
+        lease.release()
+        del st.session_state["dataset_lease"]
+    partial = st.session_state.get("partial_dataset")
+    if partial is None or partial[0] != dataset_key:
+        try:
+            partial = (dataset_key, load_dataset())
+        except ValueError as e:
+            st.error(str(e))
+            st.stop()
+        st.session_state["partial_dataset"] = partial
+    dataset = partial[1]
 else:
-    leads["Month"] = "All"
+    try:
+        new_lease = dataset_cache.acquire(dataset_key, load_dataset)
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
+    if lease is not None:
+        lease.release()
+    lease = st.session_state["dataset_lease"] = new_lease
+    st.session_state.pop("partial_dataset", None)
+    dataset = lease.value
+(leads, policies, cube, sketches, mem), periods, cell_index = dataset
+day_ranges, month_ranges = periods
+spend_key = (
+    dataset_key,
+    None if spend is None else pd.util.hash_pandas_object(spend).sum(),
+)
+if st.session_state.get("spend_key") != spend_key:
+    with profile_stage(profile, "cost allocation", len(leads)) as rec:
+        leads, cube = leads.copy(deep=False), cube.copy(deep=False)
+        leads["cost"] = allocate_cost(leads, spend)
+        set_spend(cube, leads)
+        rec["rows_out"] = len(cube)
+    st.session_state["costed"] = (leads, cube)
+    st.session_state["spend_key"] = spend_key
+leads, cube = st.session_state["costed"]
+mem_before, mem_after = mem
+if dispo_index.applied:
+    st.success("✅ Dispositions merged.")
+if sales is not None:
+    st.success("✅ Sales merged.")
+st.sidebar.caption(
+    f"Leads in memory: {mem_after / 2**20:,.1f} MB "
+    f"(was {mem_before / 2**20:,.1f} MB, "
+    f"{(1 - mem_after / mem_before) * 100 if mem_before else 0:.0f}% saved)"
+)
 
 # ── Filters & View Selector ────────────────────────────────────────────────────
-months = sorted(leads["Month"].unique())
-sel_month = st.selectbox("Month", ["All"] + months)
-sel_view = st.radio(
-    "View", ["Campaign", "Vendor", "Agent", "ZIP"], horizontal=True
+# Months and quarters are row slices of the Month-sorted cube. Weeks and date
+# ranges are row slices of the date-sorted leads, rolled into a cube of their
+# own that is kept until the range or the data changes.
+months = [k for k in month_ranges.keys if k]
+days = day_ranges.keys[day_ranges.keys != NO_DATE]
+period = st.radio(
+    "Period", ["All", "Month", "Quarter", "Week", "Date range"], horizontal=True
 )
-if sel_month != "All":
-    leads = leads[leads["Month"] == sel_month]
+sel_period = None
+if period == "Month" and months:
+    sel_period = st.selectbox("Month", [month_label(k) for k in months])
+    key = month_key(sel_period)
+    cube = cube.iloc[month_ranges.rows(key, key)]
+elif period == "Quarter" and months:
+    sel_period = st.selectbox(
+        "Quarter",
+        sorted({(k // 100, (k % 100 + 2) // 3) for k in months}),
+        format_func=lambda yq: f"{yq[0]}-Q{yq[1]}",
+    )
+    year, q = sel_period
+    cube = cube.iloc[month_ranges.rows(year * 100 + 3 * q - 2, year * 100 + 3 * q)]
+elif period in ("Week", "Date range") and len(days):
+    first, last = (pd.Timestamp(int(d), unit="D") for d in days[[0, -1]])
+    if period == "Week":
+        mondays = pd.date_range(
+            first - pd.Timedelta(days=first.weekday()), last, freq="W-MON"
+        )
+        start = st.selectbox(
+            "Week of", list(mondays), format_func=lambda d: d.strftime("%Y-%m-%d")
+        )
+        end = start + pd.Timedelta(days=6)
+    else:
+        picked = st.date_input(
+            "Dates",
+            (first.date(), last.date()),
+            min_value=first.date(),
+            max_value=last.date(),
+        )
+        # The picker returns one date while the range is being chosen.
+        start, end = picked[0], picked[-1]
+    rows = day_ranges.rows(day_key(start), day_key(end))
+    sel_period = (str(start), str(end))
+    range_key = (spend_key, rows.start, rows.stop)
+    if st.session_state.get("range_key") != range_key:
+        with profile_stage(profile, "range cube", rows.stop - rows.start) as rec:
+            range_leads = leads.iloc[rows].copy(deep=False)
+            range_cube, range_sketches = build_cube(
+                range_leads, sketches.mode, engine=engine
+            )
+            st.session_state["range_cube"] = (
+                range_cube,
+                range_sketches,
+                CellIndex(range_leads["cell"], len(range_cube), rows.start),
+            )
+            rec["rows_out"] = len(range_cube)
+        st.session_state["range_key"] = range_key
+    cube, sketches, cell_index = st.session_state["range_cube"]
+sel_view = st.radio("View", list(VIEWS), horizontal=True)
 
 # ── KPI Cards ─────────────────────────────────────────────────────────────────
 st.markdown("<div class='card-container'>", unsafe_allow_html=True)
+totals = rollup(cube, sketches=sketches)
+rows = totals["Rows"]
 cards = [
-    ("Premium", lambda df: df["Premium"].sum()),
-    ("Spend", lambda df: df["cost"].sum()),
+    ("Premium", totals["Premium"]),
+    ("Spend", round(totals["Spend"], 2)),
     (
         "Spend→Earn",
-        lambda df: round(df["Premium"].sum() / df["cost"].sum(), 2)
-        if df["cost"].sum() > 0
+        round(totals["Premium"] / totals["Spend"], 2)
+        if totals["Spend"] > 0
         else 0,
     ),
-    ("Leads", lambda df: df["email"].nunique()),
-    (
-        "Connect Rate",
-        lambda df: f"{round(df['is_connected'].mean() * 100, 1)}%",
-    ),
-    (
-        "Quote Rate",
-        lambda df: f"{round(df['is_quoted'].mean() * 100, 1)}%",
-    ),
-    (
-        "Close Rate",
-        lambda df: f"{round(df['Policy #'].ne('').mean() * 100, 1)}%",
-    ),
+    ("Leads", int(totals["Leads"])),
+    ("Connect Rate", f"{round(totals['Connects'] / rows * 100, 1)}%"),
+    ("Quote Rate", f"{round(totals['Quotes'] / rows * 100, 1)}%"),
+    ("Close Rate", f"{round(totals['Sold'] / rows * 100, 1)}%"),
 ]
-for title, fn in cards:
-    v = fn(leads)
+for title, v in cards:
     st.markdown(
         f"""
       <div class='metric-card'>
@@ -264,65 +631,215 @@ for title, fn in cards:
         unsafe_allow_html=True,
     )
 st.markdown("</div>", unsafe_allow_html=True)
+if invoice_items is not None:
+    with st.expander("Invoice spend by date and campaign"):
+        st.dataframe(
+            spend_by_date_campaign(invoice_items), use_container_width=True
+        )
 
 # ── View Panels ───────────────────────────────────────────────────────────────
+# Agent and ZIP need their column in the data (sales bring the agent).
+view_by = VIEWS[sel_view][0]
+has_view = set(view_by) <= set(cube.columns) and cube[view_by[0]].notna().any()
+table = None
+if has_view and sel_view != "ZIP":
+    with profile_stage(profile, f"view {sel_view}", len(cube)) as rec:
+        table = view_table(cube, sketches, sel_view)
+        rec["rows_out"] = len(table)
+
 if sel_view == "Campaign":
     st.subheader("Campaign View")
-    dfc = leads.groupby(["vendor", "campaign"]).agg(
-        Premium=("Premium", "sum"),
-        Spend=("cost", "sum"),
-        Leads=("email", "nunique"),
-        Connects=("is_connected", "sum"),
-        Quotes=("is_quoted", "sum"),
-        Policies=("Policy #", lambda x: x.ne("").sum()),
-    ).reset_index()
-    for col in ("Connects", "Quotes", "Policies"):
-        dfc[f"{col} Rate"] = (dfc[col] / dfc["Leads"] * 100).round(1).astype(str) + "%"
-    st.dataframe(dfc, use_container_width=True)
+    st.dataframe(table, use_container_width=True)
 
 elif sel_view == "Vendor":
     st.subheader("Vendor View")
-    dfv = leads.groupby("vendor").agg(
-        Premium=("Premium", "sum"),
-        Spend=("cost", "sum"),
-        Leads=("email", "nunique"),
-        Connects=("is_connected", "sum"),
-        Quotes=("is_quoted", "sum"),
-        Policies=("Policy #", lambda x: x.ne("").sum()),
-    ).reset_index()
-    for col in ("Connects", "Quotes", "Policies"):
-        dfv[f"{col} Rate"] = (dfv[col] / dfv["Leads"] * 100).round(1).astype(str) + "%"
-    st.dataframe(dfv, use_container_width=True)
+    st.dataframe(table, use_container_width=True)
 
 elif sel_view == "Agent":
     st.subheader("Agent Metrics")
-    if (
-        "Assigned To User" in leads.columns
-        and leads["Assigned To User"].notna().any()
-    ):
-        dfa = leads.groupby("Assigned To User").agg(
-            Leads=("email", "nunique"),
-            Policies=("Policy #", lambda x: x.ne("").sum()),
-            Connects=("is_connected", "sum"),
-            Quotes=("is_quoted", "sum"),
-        ).reset_index()
-        for col in ("Connects", "Quotes"):
-            dfa[f"{col} Rate"] = (
-                dfa[col] / dfa["Leads"] * 100
-            ).round(1).astype(str) + "%"
-        st.dataframe(dfa, use_container_width=True)
+    if table is not None:
+        st.dataframe(table, use_container_width=True)
+        with st.expander("Matched policies"):
+            st.dataframe(policies, use_container_width=True)
     else:
         st.warning("No agent data found.")
 
 else:  # ZIP
+    # Rolled up on the server to at most top + 1 bars; the chart spec is
+    # kept until the data, period, grouping or N changes.
     st.subheader("ZIP Breakdown")
-    if "Zip" in leads.columns:
-        dfz = leads.groupby("Zip").agg(
-            Leads=("email", "nunique"), Premium=("Premium", "sum")
-        ).reset_index()
-        chart = alt.Chart(dfz).mark_bar().encode(
-            x=alt.X("Zip:N", sort="-y"), y="Premium:Q"
+    if has_view:
+        zip_by = st.radio("Group ZIPs by", ZIP_LEVELS, horizontal=True)
+        top = st.slider(
+            "Top groups", min_value=5, max_value=100, value=ZIP_TOP_N, step=5
         )
-        st.altair_chart(chart, use_container_width=True)
+        chart_key = (spend_key, period, sel_period, zip_by, top)
+        if st.session_state.get("zip_chart_key") != chart_key:
+            with profile_stage(profile, f"view ZIP by {zip_by}", len(cube)) as rec:
+                table, others = zip_table(cube, sketches, zip_by, top)
+                spec = (
+                    alt.Chart(table)
+                    .mark_bar()
+                    .encode(
+                        x=alt.X(f"{zip_by}:N", sort=list(table[zip_by])),
+                        y="Premium:Q",
+                        tooltip=[zip_by, "Leads", "Premium"],
+                    )
+                    .to_dict()
+                )
+                rec["rows_out"] = len(table)
+            st.session_state["zip_chart"] = (spec, others, table)
+            st.session_state["zip_chart_key"] = chart_key
+        spec, others, table = st.session_state["zip_chart"]
+        st.vega_lite_chart(spec, use_container_width=True)
+        if others:
+            st.caption(f"{ZIP_OTHER} sums {others:,} more {zip_by} groups.")
     else:
         st.warning("No ZIP data found.")
+
+# ── Lead Drill-down ───────────────────────────────────────────────────────────
+# The leads behind one row of the current view, gathered through the cell
+# index and sorted once per selection; paging only slices that order.
+if table is not None and len(table):
+    with st.expander("🔎 Leads behind a row"):
+        drill_by = [zip_by] if sel_view == "ZIP" else view_by
+        keys = list(table[drill_by].itertuples(index=False, name=None))
+        drill_row = st.selectbox(
+            "Row", keys, format_func=lambda k: " / ".join(map(str, k))
+        )
+        sort_by = st.selectbox(
+            "Sort leads by", [c for c in DRILL_SORTS if c in leads.columns]
+        )
+        descending = st.checkbox("Descending", value=True)
+        drill_key = (
+            spend_key,
+            period,
+            sel_period,
+            sel_view,
+            tuple(drill_by),
+            tuple(keys) if sel_view == "ZIP" else None,
+            drill_row,
+            sort_by,
+            descending,
+        )
+        if st.session_state.get("drill_key") != drill_key:
+            with profile_stage(profile, "drill-down", len(cube)) as rec:
+                if sel_view == "ZIP":
+                    cells = zip_cells(cube, zip_by, drill_row[0], table[zip_by])
+                else:
+                    cells = view_cells(cube, view_by, drill_row)
+                drill_rows = sort_rows(
+                    leads, cell_index.rows(cells), sort_by, descending
+                )
+                rec["rows_out"] = len(drill_rows)
+            st.session_state["drill_rows"] = drill_rows
+            st.session_state["drill_key"] = drill_key
+        drill_rows = st.session_state["drill_rows"]
+        pages = max(-(-len(drill_rows) // DRILL_PAGE_ROWS), 1)
+        page = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1)
+        first = (page - 1) * DRILL_PAGE_ROWS
+        st.caption(
+            f"Leads {min(first + 1, len(drill_rows)):,}–"
+            f"{min(first + DRILL_PAGE_ROWS, len(drill_rows)):,} "
+            f"of {len(drill_rows):,} · page {page} of {pages}"
+        )
+        st.dataframe(
+            drill_page(leads, drill_rows, page - 1), use_container_width=True
+        )
+
+# ── SQL Query ─────────────────────────────────────────────────────────────────
+# Questions the fixed views don't answer, in SQL over the loaded leads and the
+# Parquet history on disk (see lead_sql). The result is kept in session_state
+# so switching between table and chart does not re-run the query.
+with st.expander("🧮 SQL query"):
+    sql = st.text_area("SQL", EXAMPLE_QUERY, height=140)
+    if st.button("Run query"):
+        try:
+            with connect(
+                LEAD_STORE_DIR,
+                CACHE_DIR,
+                leads,
+                os.environ.get("LEAD_SQL_MEMORY"),
+                sales,
+            ) as con:
+                st.session_state["sql_tables"] = tables(con)
+                st.session_state["sql_result"] = query(con, sql)
+        except Exception as e:
+            st.session_state["sql_result"] = e
+    if "sql_tables" in st.session_state:
+        st.caption("Tables: " + ", ".join(st.session_state["sql_tables"]))
+    result = st.session_state.get("sql_result")
+    if isinstance(result, Exception):
+        st.error(f"Query failed: {result}")
+    elif result is not None and result[0] is not None:
+        qdf, truncated = result
+        if truncated:
+            st.caption(f"Showing the first {SQL_MAX_ROWS:,} rows.")
+        numeric = list(qdf.select_dtypes("number").columns)
+        show = st.radio(
+            "Show as", ["Table", "Bar chart", "Line chart"], horizontal=True
+        )
+        if show == "Table" or len(qdf.columns) < 2 or not numeric:
+            st.dataframe(qdf, use_container_width=True)
+        else:
+            x = st.selectbox("X", list(qdf.columns))
+            y = st.selectbox("Y", numeric, index=len(numeric) - 1)
+            if show == "Bar chart":
+                chart = alt.Chart(qdf).mark_bar().encode(
+                    x=alt.X(field=x, type="nominal", sort="-y"),
+                    y=alt.Y(field=y, type="quantitative"),
+                )
+            else:
+                temporal = pd.api.types.is_datetime64_any_dtype(qdf[x])
+                chart = alt.Chart(qdf).mark_line().encode(
+                    x=alt.X(field=x, type="temporal" if temporal else "ordinal"),
+                    y=alt.Y(field=y, type="quantitative"),
+                )
+            st.altair_chart(chart, use_container_width=True)
+
+# ── Stage Profile ─────────────────────────────────────────────────────────────
+# Inputs are compared with the previous run to name the widget(s) whose change
+# caused this rerun. With profiling on, the stages that actually ran are shown
+# in the sidebar and appended to a JSON-lines log.
+PROFILE_LOG = os.environ.get("LEAD_DASHBOARD_PROFILE_LOG", "lead_profile.jsonl")
+inputs = {
+    "Lead CSVs": tuple(lead_keys),
+    "Parsed lead files": tuple(k for k in lead_keys if k in frames),
+    "Sales": sales_key,
+    "Dispositions": dispo_digests,
+    "Billing PDFs": invoice_key,
+    "SmartFinancial Total Spend": manual_spend,
+    "Parallel parsing": parallel_ingest,
+    "Distinct lead counting": distinct_mode,
+    "Fuzzy name matching": fuzzy_names,
+    "Pipeline engine": engine,
+    "Lead history store": use_store,
+    "Period": (period, sel_period),
+    "View": sel_view,
+    "ZIP grouping": (zip_by, top) if sel_view == "ZIP" and has_view else None,
+}
+last_inputs = st.session_state.get("last_inputs")
+if last_inputs is None:
+    trigger = ["first run"]
+else:
+    trigger = [k for k, v in inputs.items() if last_inputs.get(k) != v]
+st.session_state["last_inputs"] = inputs
+if profile is not None:
+    total = time.perf_counter() - run_started
+    profile.log(
+        PROFILE_LOG,
+        time=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        trigger=trigger,
+        total_seconds=total,
+    )
+    with st.sidebar.expander("⏱️ Stage profile"):
+        st.caption(
+            f"Rerun by: {', '.join(trigger) or 'no input change'} · "
+            f"{total:.2f}s total"
+        )
+        stages = pd.DataFrame(
+            profile.stages,
+            columns=["stage", "seconds", "peak_bytes", "rows_in", "rows_out"],
+        )
+        stages["peak MB"] = (stages.pop("peak_bytes") / 2**20).round(1)
+        st.dataframe(stages.round({"seconds": 3}), use_container_width=True)
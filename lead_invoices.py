@@ -0,0 +1,117 @@
+import hashlib
+import os
+import re
+
+import pandas as pd
+
+from lead_pipeline import get_pool
+
+# ── SmartFinancial Invoice Spend ──────────────────────────────────────────────
+# Billing PDFs are split into page ranges that pool workers extract in
+# parallel. Each charge line ("<amount> 0.00 0.00 ... <Product> Insurance
+# Lead") becomes a line item dated by the closest date printed above it.
+# Results are cached per PDF digest, so re-running a year of invoices only
+# extracts the new ones.
+INVOICE_PARSER_VERSION = 2
+PAGES_PER_TASK = 8
+# One charge per line: the campaign must be on the amount's own line, or a
+# fee line would take the next line's campaign.
+CHARGE = re.compile(
+    r"(\d[\d,]*\.\d{2})\s+0\.00\s+0\.00[^\n]*?([A-Za-z]+)\s+Insurance Lead"
+)
+DATE = re.compile(r"\b(\d{1,2}/\d{1,2}/\d{2,4})\b")
+
+def extract_pages(name, data, start, stop):
+    import fitz  # PyMuPDF, only needed for invoice PDFs
+
+    items = []
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for page_no in range(start, min(stop, doc.page_count)):
+            text = doc[page_no].get_text()
+            dates = [(m.start(), m.group(1)) for m in DATE.finditer(text)]
+            for m in CHARGE.finditer(text):
+                before = [d for pos, d in dates if pos < m.start()]
+                items.append(
+                    {
+                        "pdf": name,
+                        "page": page_no + 1,
+                        "date": before[-1] if before else None,
+                        "campaign": m.group(2).strip(),
+                        "amount": float(m.group(1).replace(",", "")),
+                    }
+                )
+    return items
+
+def _page_count(data):
+    import fitz
+
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        return doc.page_count
+
+def _read(f):
+    if isinstance(f, str):
+        with open(f, "rb") as fh:
+            return os.path.basename(f), fh.read()
+    return f.name, f.getvalue()
+
+def _finish(items):
+    df = pd.DataFrame(items, columns=["pdf", "page", "date", "campaign", "amount"])
+    # Charges on pages without a printed date take the last date before them.
+    df = df.sort_values(["pdf", "page"], kind="stable")
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    df["date"] = df.groupby("pdf")["date"].ffill()
+    return df.reset_index(drop=True)
+
+def extract_invoice_spend(files, cache_dir=None, workers=None):
+    """Line-item spend (pdf, page, date, campaign, amount) for billing PDFs.
+
+    ``files`` are paths or uploaded files.
+    """
+    pdfs = [_read(f) for f in files]
+    cached, tasks = [], []
+    for name, data in pdfs:
+        path = None
+        if cache_dir:
+            digest = hashlib.sha256(data).hexdigest()
+            path = os.path.join(
+                cache_dir, f"invoice-{digest}-v{INVOICE_PARSER_VERSION}.parquet"
+            )
+            if os.path.exists(path):
+                cached.append(pd.read_parquet(path).assign(pdf=name))
+                continue
+        pages = _page_count(data)
+        for start in range(0, max(pages, 1), PAGES_PER_TASK):
+            tasks.append((name, data, start, start + PAGES_PER_TASK, path))
+    if workers == 1 or len(tasks) < 2:
+        results = [extract_pages(*t[:4]) for t in tasks]
+    else:
+        results = list(
+            get_pool().map(
+                extract_pages,
+                *zip(*[t[:4] for t in tasks]),
+            )
+        )
+    fresh = {}
+    for (name, _, _, _, path), items in zip(tasks, results):
+        fresh.setdefault((name, path), []).extend(items)
+    frames = cached
+    for (name, path), items in fresh.items():
+        df = _finish(items)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            df.to_parquet(path, index=False)
+        frames.append(df)
+    if not frames:
+        return _finish([])
+    return pd.concat(frames, ignore_index=True)
+
+def spend_by_date_campaign(items):
+    return (
+        items.groupby(["date", "campaign"], dropna=False)["amount"]
+        .sum()
+        .reset_index()
+    )
+
+def invoice_spend(items, vendor="SmartFinancial"):
+    """Spend table for allocate_cost from invoice line items."""
+    return spend_by_date_campaign(items).assign(vendor=vendor)
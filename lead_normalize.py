@@ -0,0 +1,185 @@
+"""Vectorized normalization of the identity fields: email, phone, name, ZIP.
+
+Every kernel takes a pandas Series (or a pyarrow array) and returns the same
+kind. Text columns (pandas' Arrow-backed "str" dtype) convert to Arrow
+without a copy; other columns are cast to text first. The work runs on the
+Arrow buffers: pyarrow.compute for case and trimming, and numpy over the
+UTF-8 bytes for digit extraction and whitespace, in place of per-row
+regular expressions. Empty and "nan"/"none"/"null" values come back
+missing.
+"""
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+BLANKS = ["", "nan", "none", "null", "NAN", "NONE", "NULL"]
+GMAIL_DOMAINS = ["gmail.com", "googlemail.com"]
+_WHITESPACE = np.frombuffer(b" \t\n\r\x0b\x0c", dtype=np.uint8)
+
+def _kernel(fn):
+    @wraps(fn)
+    def run(values):
+        if not isinstance(values, pd.Series):
+            if isinstance(values, pa.ChunkedArray):
+                values = values.combine_chunks()
+            return fn(values.cast(pa.large_string()))
+        text = values
+        if not pd.api.types.is_string_dtype(text.dtype) or text.dtype == object:
+            text = text.astype(str).where(text.notna())
+        arr = pa.array(text, type=pa.large_string(), from_pandas=True)
+        if isinstance(arr, pa.ChunkedArray):  # e.g. after pd.concat
+            arr = arr.combine_chunks()
+        out = fn(arr)
+        return pd.Series(pd.array(out, dtype="str"), index=values.index)
+
+    return run
+
+# ── Byte Helpers ──────────────────────────────────────────────────────────────
+def _buffers(arr):
+    """(offsets, data) of a string array as numpy, rebased to start at 0."""
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    arr = arr.cast(pa.large_string())
+    _, offsets, data = arr.buffers()
+    offsets = np.frombuffer(offsets, dtype=np.int64)[
+        arr.offset : arr.offset + len(arr) + 1
+    ]
+    if data is None:
+        return offsets - offsets[0], np.zeros(0, dtype=np.uint8)
+    data = np.frombuffer(data, dtype=np.uint8)[offsets[0] : offsets[-1]]
+    return offsets - offsets[0], data
+
+def _from_buffers(offsets, data, valid):
+    """large_string array from numpy buffers; rows not ``valid`` are null."""
+    return pa.LargeStringArray.from_buffers(
+        len(valid),
+        pa.py_buffer(np.ascontiguousarray(offsets, dtype=np.int64)),
+        pa.py_buffer(np.ascontiguousarray(data, dtype=np.uint8)),
+        pa.array(valid).buffers()[1],
+        int(len(valid) - valid.sum()),
+    )
+
+def _filter_bytes(offsets, data, drop, stop=None):
+    """Drop the bytes where ``drop``, and each row's bytes from its first
+    ``stop`` byte on; returns the new (offsets, data)."""
+    keep = ~drop
+    if stop is not None:
+        seen = np.cumsum(stop, dtype=np.int64)
+        before = np.r_[0, seen][offsets[:-1]]
+        keep &= seen == np.repeat(before, np.diff(offsets))
+    kept = np.r_[0, np.cumsum(keep, dtype=np.int64)]
+    return kept[offsets], data[keep]
+
+def _take_bytes(data, start, length, prefix=None):
+    """Row i is ``data[start[i]:start[i] + length[i]]``, after a "+" where
+    ``prefix`` is set; returns (offsets, data)."""
+    lead = np.zeros(len(start), dtype=np.int64) if prefix is None else prefix
+    size = length + lead
+    offsets = np.r_[0, np.cumsum(size)]
+    src = np.repeat(start - offsets[:-1] - lead, size) + np.arange(offsets[-1])
+    out = data[np.clip(src, 0, max(len(data) - 1, 0))] if len(data) else data[:0]
+    if prefix is not None:
+        out[offsets[:-1][prefix.astype(bool)]] = ord("+")
+    return offsets, out
+
+def _digits(data):
+    return (data >= ord("0")) & (data <= ord("9"))
+
+def _blank_to_null(arr):
+    return pc.if_else(pc.is_in(arr, pa.array(BLANKS)), None, arr)
+
+# ── Kernels ───────────────────────────────────────────────────────────────────
+@_kernel
+def clean_email(arr):
+    """Lowercase, trimmed email."""
+    return _blank_to_null(pc.utf8_trim_whitespace(pc.utf8_lower(arr)))
+
+@_kernel
+def email_key(arr):
+    """clean_email with Gmail aliases folded: dots and "+tag" dropped from
+    the local part, googlemail.com read as gmail.com. Missing if no local
+    part is left (e.g. "+tag@gmail.com")."""
+    email = clean_email(arr)
+    for domain in GMAIL_DOMAINS:
+        gmail = pc.fill_null(pc.ends_with(email, "@" + domain), False)
+        if not pc.any(gmail).as_py():
+            continue
+        offsets, data = _buffers(pc.filter(email, gmail))
+        data = data.copy()
+        # Cut each address at its "@domain" so only the local part is kept.
+        data[offsets[1:] - len(domain) - 1] = ord("+")
+        offsets, local = _filter_bytes(
+            offsets, data, data == ord("."), data == ord("+")
+        )
+        folded = pc.binary_join_element_wise(
+            _from_buffers(offsets, local, np.diff(offsets) > 0),
+            pa.scalar("gmail.com", pa.large_string()),
+            pa.scalar("@", pa.large_string()),
+        )
+        email = pc.replace_with_mask(email, gmail, folded)
+    return email
+
+@_kernel
+def normalize_phone(arr):
+    """10-digit NANP number, or E.164 ("+" and digits) for other countries.
+
+    Punctuation, a "+1"/"1" country code, extensions ("x12", "ext. 12",
+    "#12": everything from the first letter or "#") and the ".0" of numbers
+    read from Excel as floats are dropped; anything else is missing.
+    """
+    arr = pc.utf8_trim_whitespace(arr)
+    plus = pc.fill_null(pc.starts_with(arr, "+"), False)
+    plus = plus.to_numpy(zero_copy_only=False)
+    offsets, data = _buffers(arr)
+    letter = ((data | 0x20) >= ord("a")) & ((data | 0x20) <= ord("z"))
+    stop = letter | (data == ord("#"))
+    ends = offsets[1:]
+    excel = np.diff(offsets) >= 2
+    excel[excel] = (data[ends[excel] - 2] == ord(".")) & (
+        data[ends[excel] - 1] == ord("0")
+    )
+    stop[ends[excel] - 2] = True
+    offsets, digits = _filter_bytes(offsets, data, ~_digits(data), stop)
+    n = np.diff(offsets)
+    one = n > 0
+    one[one] = digits[offsets[:-1][one]] == ord("1")
+    nanp = ((n == 10) & ~plus) | ((n == 11) & one)
+    foreign = plus & ~one & (n >= 8) & (n <= 15)
+    valid = (nanp | foreign) & arr.is_valid().to_numpy(zero_copy_only=False)
+    start = np.where(nanp, offsets[1:] - 10, offsets[:-1])
+    length = np.where(valid, np.where(nanp, 10, n), 0)
+    offsets, out = _take_bytes(
+        digits, start, length, (foreign & valid).astype(np.int64)
+    )
+    return _from_buffers(offsets, out, valid)
+
+@_kernel
+def normalize_name(arr):
+    """Uppercase name with single spaces."""
+    offsets, data = _buffers(pc.utf8_upper(arr))
+    space = np.isin(data, _WHITESPACE)
+    repeat = space & np.r_[False, space[:-1]]
+    repeat[offsets[:-1][np.diff(offsets) > 0]] = False  # a row's first byte
+    offsets, data = _filter_bytes(
+        offsets, np.where(space, ord(" "), data).astype(np.uint8), repeat
+    )
+    valid = arr.is_valid().to_numpy(zero_copy_only=False)
+    name = _from_buffers(offsets, data, valid)
+    return _blank_to_null(pc.utf8_trim_whitespace(name))
+
+@_kernel
+def normalize_zip(arr):
+    """First five digits, zero-padded (ZIP+4 and Excel floats included)."""
+    offsets, data = _buffers(arr)
+    offsets, digits = _filter_bytes(
+        offsets, data, ~_digits(data), data == ord(".")
+    )
+    n = np.diff(offsets)
+    valid = (n > 0) & arr.is_valid().to_numpy(zero_copy_only=False)
+    offsets, digits = _take_bytes(
+        digits, offsets[:-1], np.where(valid, np.minimum(n, 5), 0)
+    )
+    return pc.utf8_lpad(_from_buffers(offsets, digits, valid), 5, "0")
@@ -0,0 +1,1519 @@
+import copy
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+import pandas as pd
+
+from lead_normalize import (
+    clean_email,
+    email_key,
+    normalize_name,
+    normalize_phone,
+    normalize_zip,
+)
+
+# Bump when parse_lead_file / parse_sales_file output changes so stale cached
+# results (in memory and on disk) are never served.
+PARSER_VERSION = 6
+
+# ── Execution Engine ──────────────────────────────────────────────────────────
+# "pandas" (default) or "polars". The Polars engine (lead_polars) runs lead
+# parsing, key joins and the cube group-by on Arrow-backed Polars frames
+# behind the same functions, and produces the same tables. Both engines
+# normalize identity fields with the Arrow kernels in lead_normalize.
+# Entry points take ``engine``; ENGINE is only the default for callers that
+# pass none, so a long-lived process (the dashboard) never changes it.
+ENGINES = ("pandas", "polars")
+ENGINE = os.environ.get("LEAD_PIPELINE_ENGINE", "pandas")
+
+def set_engine(name):
+    global ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"unknown engine {name!r}; expected one of {ENGINES}")
+    ENGINE = name
+
+def _polars(engine=None):
+    if (engine or ENGINE) != "polars":
+        return None
+    import lead_polars  # optional dependency, only needed for this engine
+
+    return lead_polars
+
+# ── Stage Profiling ───────────────────────────────────────────────────────────
+# Opt-in: pass a StageProfile to the pipeline to record wall time, rows in and
+# out and, with memory=True, the peak traced allocation of each stage.
+# Allocations in pool workers are not traced.
+class StageProfile:
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Time the block; set ``rows_out`` on the yielded record."""
+        rec = {"stage": name, "rows_in": rows_in, "rows_out": None}
+        if self.memory:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec["seconds"] = time.perf_counter() - t0
+            if self.memory:
+                rec["peak_bytes"] = tracemalloc.get_traced_memory()[1] - base
+                if started:
+                    tracemalloc.stop()
+            self.stages.append(rec)
+
+    def log(self, path, **extra):
+        """Append the stages (and ``extra`` fields) as one JSON line."""
+        entry = dict(extra, stages=self.stages)
+        with open(path, "a") as fh:
+            fh.write(json.dumps(entry, default=str) + "\n")
+
+def profile_stage(profile, name, rows_in=None):
+    return profile.stage(name, rows_in) if profile else nullcontext({})
+
+# ── Vendor Schema Registry ───────────────────────────────────────────────────
+# Lead columns are found by substring match on the header. The mapping is
+# resolved once per vendor/header layout from the header row alone, and only
+# the mapped columns are read, with explicit dtypes.
+LEAD_FIELDS = {
+    "email": "email",
+    "first_name": "first",
+    "last_name": "last",
+    "Phone": "phone",
+    "Created Date": "date",
+    "Zip": "zip",
+}
+LEAD_DTYPES = {
+    "email": str,
+    "first_name": str,
+    "last_name": str,
+    "Phone": str,
+    "Created Date": str,
+    "Zip": str,
+    "cost": str,
+}
+_schemas = {}
+
+def resolve_schema(vendor, header):
+    key = (vendor.lower(), tuple(header))
+    if key not in _schemas:
+        schema = {}
+        for field, needle in LEAD_FIELDS.items():
+            hits = [c for c in header if needle in c.strip().lower()]
+            if hits:
+                schema[field] = hits[0]
+        if vendor.lower() == "eq":
+            hits = [c for c in header if c.strip() == "cost"]
+            if hits:
+                schema["cost"] = hits[0]
+        _schemas[key] = schema
+    return _schemas[key]
+
+# ── Parsing Helpers ──────────────────────────────────────────────────────────
+def parse_lead_file(f, engine=None):
+    if _polars(engine):
+        return _polars(engine).parse_lead_file(f)
+    basename = f.name.rsplit(".", 1)[0]
+    for sep in ("_", "-", " "):
+        if sep in basename:
+            vendor, campaign = basename.split(sep, 1)
+            break
+    else:
+        return None
+    try:
+        header = pd.read_csv(f, nrows=0).columns
+        f.seek(0)
+        schema = resolve_schema(vendor, header)
+        src = pd.read_csv(
+            f,
+            usecols=sorted(set(schema.values())) or list(header[:1]),
+            dtype={c: LEAD_DTYPES[k] for k, c in schema.items()},
+        )
+    except:
+        return None
+    df = pd.DataFrame(index=src.index)
+    df["vendor"] = vendor
+    df["campaign"] = campaign
+    # Email
+    df["email"] = clean_email(src[schema["email"]]) if "email" in schema else None
+    # Names
+    for field in ("first_name", "last_name"):
+        df[field] = src[schema[field]].astype(str) if field in schema else None
+    # Cost as billed on the file; see allocate_cost
+    df["cost"] = 0.0
+    if "cost" in schema:
+        df["cost"] = pd.to_numeric(src[schema["cost"]], errors="coerce").fillna(0)
+    # Phone
+    df["Phone"] = normalize_phone(src[schema["Phone"]]) if "Phone" in schema else None
+    # Created Date
+    if "Created Date" in schema:
+        df["Created Date"] = pd.to_datetime(
+            src[schema["Created Date"]], errors="coerce"
+        )
+    # Zip
+    if "Zip" in schema:
+        df["Zip"] = src[schema["Zip"]]
+    return df
+
+def normalize_sales(df):
+    df = df.rename(columns=lambda c: str(c).strip())
+    # Email
+    em = [c for c in df.columns if "email" in c.lower()]
+    df["email"] = clean_email(df[em[0]]) if em else None
+    # Assigned To User
+    au = [c for c in df.columns if "assign" in c.lower()]
+    df["Assigned To User"] = df[au[0]].astype(str) if au else None
+    # Policy/Premium/Items defaults
+    for col in ("Policy #", "Premium", "Items"):
+        if col not in df.columns:
+            df[col] = 0 if col != "Policy #" else ""
+    df["Premium"] = pd.to_numeric(df["Premium"], errors="coerce").fillna(0)
+    df["Items"] = pd.to_numeric(df["Items"], errors="coerce").fillna(0)
+    # Identity fields used to match sales without an email
+    ph = [c for c in df.columns if "phone" in c.lower()]
+    df["Phone"] = df[ph[0]] if ph else None
+    fn = [c for c in df.columns if "first" in c.lower() and "name" in c.lower()]
+    ln = [c for c in df.columns if "last" in c.lower() and "name" in c.lower()]
+    df["first_name"] = df[fn[0]] if fn else None
+    df["last_name"] = df[ln[0]] if ln else None
+    if "Customer" not in df.columns:
+        df["Customer"] = None
+    zp = [c for c in df.columns if "zip" in c.lower()]
+    df["Zip"] = df[zp[0]] if zp else None
+    df = df[
+        [
+            "email",
+            "Policy #",
+            "Premium",
+            "Items",
+            "Assigned To User",
+            "Phone",
+            "first_name",
+            "last_name",
+            "Customer",
+            "Zip",
+        ]
+    ]
+    # Excel cells mix numbers and text; keep identifiers as text so the
+    # frame has one type per column (and can be written to Parquet).
+    for col in ("Policy #", "Phone", "Customer", "Zip"):
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+# ── Excel Sales Workbooks ─────────────────────────────────────────────────────
+# Workbooks are read with calamine when it is installed (much faster than
+# openpyxl), keeping only the columns normalize_sales uses. Sheets are read
+# one per pool worker. The parsed result is written to Parquet keyed by the
+# workbook digest, so a workbook is converted once per parser version.
+try:
+    import python_calamine  # noqa: F401
+
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = None
+
+def _sales_column(name):
+    name = str(name).strip()
+    low = name.lower()
+    return (
+        name in ("Policy #", "Premium", "Items", "Customer")
+        or any(k in low for k in ("email", "assign", "phone", "zip"))
+        or ("name" in low and ("first" in low or "last" in low))
+    )
+
+def read_sheet(data, sheet):
+    return pd.read_excel(
+        io.BytesIO(data), sheet_name=sheet, usecols=_sales_column, engine=EXCEL_ENGINE
+    )
+
+def read_workbook(data):
+    sheets = pd.ExcelFile(io.BytesIO(data), engine=EXCEL_ENGINE).sheet_names
+    if len(sheets) < 2:
+        return [read_sheet(data, sheets[0])]
+    frames = list(get_pool().map(read_sheet, [data] * len(sheets), sheets))
+    # Keep the sheets that look like sales (summary tabs have neither).
+    sales = [
+        d
+        for d in frames
+        if any("Policy #" == str(c).strip() or "email" in str(c).lower() for c in d.columns)
+    ]
+    return sales or frames[:1]
+
+def parse_sales_file(f, cache_dir=None):
+    excel = f.name.lower().endswith(("xls", "xlsx"))
+    data = f.getvalue() if hasattr(f, "getvalue") else f.read()
+    path = None
+    if excel and cache_dir:
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(cache_dir, f"sales-{digest}-v{PARSER_VERSION}.parquet")
+        if os.path.exists(path):
+            return pd.read_parquet(path)
+    try:
+        frames = (
+            read_workbook(data) if excel else [pd.read_csv(io.BytesIO(data))]
+        )
+    except:
+        return None
+    df = pd.concat([normalize_sales(d) for d in frames], ignore_index=True)
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        df.to_parquet(path, index=False)
+    return df
+
+# ── Parallel Ingestion ───────────────────────────────────────────────────────
+# The pool lives for the whole process so Streamlit reruns reuse warm
+# workers. It is sized once (LEAD_PIPELINE_WORKERS, default one per CPU) and
+# only replaced when broken, e.g. after a worker was killed for running out
+# of memory. Streamlit executes the dashboard as __main__, and "spawn" workers
+# re-run __main__ on start-up, so fork wherever the platform allows it.
+_START_METHOD = (
+    "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+)
+POOL_WORKERS = int(os.environ.get("LEAD_PIPELINE_WORKERS") or os.cpu_count() or 1)
+_pool = None
+
+def get_pool():
+    global _pool
+    if _pool is None or getattr(_pool, "_broken", False):
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(
+            max_workers=POOL_WORKERS,
+            mp_context=multiprocessing.get_context(_START_METHOD),
+        )
+    return _pool
+
+def submit(fn, *args):
+    """get_pool().submit, or a future holding the error if the pool refuses
+    the task, so one failure is reported against its own file."""
+    try:
+        return get_pool().submit(fn, *args)
+    except Exception as e:  # e.g. BrokenProcessPool
+        future = Future()
+        future.set_exception(e)
+        return future
+
+def parse_upload(name, data, engine=None):
+    f = io.BytesIO(data)
+    f.name = name
+    try:
+        df = parse_lead_file(f, engine)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+    if df is None:
+        return None, "unrecognised filename or unreadable CSV"
+    return df, None
+
+def profile_upload(name, data, engine=None, memory=False):
+    """parse_upload plus its StageProfile record, measured in the worker."""
+    profile = StageProfile(memory)
+    with profile.stage(f"parse {name}", max(data.count(b"\n") - 1, 0)) as rec:
+        df, err = parse_upload(name, data, engine)
+        rec["rows_out"] = 0 if df is None else len(df)
+    return df, err, profile.stages[0]
+
+def _parse_calls(files, engine, profile=None):
+    """The parse function and one argument tuple per file."""
+    names = [f.name for f in files]
+    args = [names, [f.getvalue() for f in files], [engine] * len(files)]
+    if profile is None:
+        return parse_upload, list(zip(*args))
+    return profile_upload, list(zip(*args, [profile.memory] * len(files)))
+
+def _in_process(files, workers, engine):
+    return len(files) < 2 or workers == 1 or engine == "polars"
+
+def _result(name, result, profile=None):
+    df, err, *rec = result
+    if rec and profile is not None:
+        profile.stages.append(rec[0])
+    return name, df, err
+
+def parse_lead_files(files, workers=None, profile=None, engine=None):
+    """Parse uploads across the process pool (in-process with ``workers=1``).
+
+    Returns (name, frame, error) per file in the same order as ``files``, so
+    concatenation is deterministic whatever order the workers finish in.
+    With ``profile`` each file is recorded as its own stage. The engine is
+    passed explicitly since forked workers keep the engine of their fork;
+    Polars parses in-process, as its thread pool is not fork-safe. A file
+    whose worker dies gets an error like any other unreadable file.
+    """
+    engine = engine or ENGINE
+    parse, calls = _parse_calls(files, engine, profile)
+    if _in_process(files, workers, engine):
+        return [_result(f.name, parse(*a), profile) for f, a in zip(files, calls)]
+    jobs = [IngestJob(f.name, submit(parse, *a)) for f, a in zip(files, calls)]
+    return [job.result(profile) for job in jobs]
+
+# ── Background Ingestion ─────────────────────────────────────────────────────
+# The dashboard submits uploads here instead of waiting on parse_lead_files,
+# so a rerun finds the work in flight and reports its progress instead of
+# starting it again. Files go to the process pool as separate tasks, or, when
+# parsing stays in-process, to one background thread.
+_thread = None
+
+def get_thread():
+    global _thread
+    if _thread is None:
+        _thread = ThreadPoolExecutor(1, thread_name_prefix="lead-parse")
+    return _thread
+
+class IngestJob:
+    """One upload being parsed in the background."""
+
+    def __init__(self, name, future):
+        self.name = name
+        self.future = future
+
+    @property
+    def status(self):
+        if not self.future.done():
+            return "parsing" if self.future.running() else "queued"
+        return "failed" if self.result()[2] else "done"
+
+    def result(self, profile=None):
+        """(name, frame, error) like parse_lead_files; blocks until done."""
+        try:
+            return _result(self.name, self.future.result(), profile)
+        except Exception as e:  # e.g. a worker process died
+            return self.name, None, f"{type(e).__name__}: {e}"
+
+    def cancel(self):
+        return self.future.cancel()
+
+def submit_lead_files(files, workers=None, profile=None, engine=None):
+    """Start parsing ``files`` without waiting; returns an IngestJob per file.
+
+    With ``profile`` each job's result carries its stage record, added to
+    the profile passed to IngestJob.result.
+    """
+    engine = engine or ENGINE
+    parse, calls = _parse_calls(files, engine, profile)
+    if _in_process(files, workers, engine):
+        jobs = [get_thread().submit(parse, *a) for a in calls]
+    else:
+        jobs = [submit(parse, *a) for a in calls]
+    return [IngestJob(f.name, job) for f, job in zip(files, jobs)]
+
+# ── Identity Resolution ───────────────────────────────────────────────────────
+# Leads are matched to sales and disposition records on normalized email
+# (Gmail aliases folded), then phone, then name + ZIP; see lead_normalize.
+# Each source gets one hash index per key, so a join is a single linear
+# lookup pass over the lead keys rather than one DataFrame merge per key.
+# The key used is recorded as a confidence score.
+MATCH_KEYS = {"email": 1.0, "phone": 0.9, "name_zip": 0.6}
+
+def _missing(index):
+    return pd.Series(np.nan, index=index, dtype=object)
+
+def identity_keys(df, engine=None):
+    """Normalized email / phone / name+zip keys for any lead-like frame."""
+    if _polars(engine):
+        return _polars(engine).identity_keys(df)
+    keys = pd.DataFrame(index=df.index)
+    keys["email"] = (
+        email_key(df["email"]) if "email" in df.columns else _missing(df.index)
+    )
+    keys["phone"] = (
+        normalize_phone(df["Phone"]) if "Phone" in df.columns else _missing(df.index)
+    )
+    if "Customer" in df.columns and df["Customer"].notna().any():
+        name = normalize_name(df["Customer"])
+    elif "first_name" in df.columns and "last_name" in df.columns:
+        name = (
+            normalize_name(df["first_name"]) + " " + normalize_name(df["last_name"])
+        )
+    else:
+        name = _missing(df.index)
+    if "Zip" in df.columns and name.notna().any():
+        keys["name_zip"] = name + "|" + normalize_zip(df["Zip"])
+    else:
+        # Disposition exports often have names but no ZIP.
+        keys["name_zip"] = _missing(df.index)
+    keys["name"] = name
+    return keys
+
+class IdentityIndex:
+    """Hash index from each match key to the first record holding it."""
+
+    def __init__(self, keys):
+        self._indexes = {}
+        for key in MATCH_KEYS:
+            values = keys[key].to_numpy()
+            first = keys[key].notna().to_numpy() & ~keys[key].duplicated().to_numpy()
+            self._indexes[key] = (pd.Index(values[first]), np.flatnonzero(first))
+
+    def resolve(self, keys):
+        """Record position per lead (-1 if unmatched) and match confidence."""
+        pos = np.full(len(keys), -1, dtype=np.int64)
+        confidence = np.zeros(len(keys))
+        for key, score in MATCH_KEYS.items():
+            index, rows = self._indexes[key]
+            todo = np.flatnonzero(pos < 0)
+            if not len(index) or not len(todo):
+                continue
+            hit = index.get_indexer(keys[key].to_numpy()[todo])
+            found = hit >= 0
+            pos[todo[found]] = rows[hit[found]]
+            confidence[todo[found]] = score
+        return pos, confidence
+
+def resolve_keys(records, keys, engine=None):
+    """Position in ``records`` of each row of ``keys`` and match confidence."""
+    if _polars(engine):
+        return _polars(engine).resolve(records, keys)
+    return IdentityIndex(records).resolve(keys)
+
+def _take(values, pos, fill):
+    out = np.full(len(pos), fill, dtype=values.dtype if fill == 0 else object)
+    hit = pos >= 0
+    out[hit] = values[pos[hit]]
+    return out
+
+# ── Fuzzy Name Matching ───────────────────────────────────────────────────────
+# Optional fallback for leads the exact keys missed. Names are blocked on a
+# Soundex code of the last name (each part of a hyphenated name) plus the
+# first two letters of the first name, so only names in the same block are
+# compared. Pairs are scored with a vectorized character-bigram Dice
+# coefficient, a chunk of lead names at a time to bound memory. Each distinct
+# name in a block is scored once, however many leads or records share it.
+# Blocks that would still need more than FUZZY_BLOCK_MAX_PAIRS comparisons
+# (common names) are split on the third and fourth letters of the first name.
+FUZZY_THRESHOLD = 0.8
+FUZZY_CONFIDENCE = 0.5
+FUZZY_BLOCK_MAX_PAIRS = 1_000_000
+_SOUNDEX = str.maketrans(
+    "AEIOUYHWBFPVCGJKQSXZDTLMNR", "00000099111122222222334556"
+)
+_NAME_WIDTH = 24
+_NAME_CHARS = np.zeros(256, dtype=np.int16)
+_NAME_CHARS[list(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ -")] = np.arange(1, 29)
+
+def soundex(s):
+    letters = s.str.replace(r"[^A-Z]", "", regex=True)
+    codes = letters.str.translate(_SOUNDEX).str.replace("9", "", regex=False)
+    for d in "0123456":
+        codes = codes.str.replace(f"{d}+", d, regex=True)
+    # The first letter is kept as-is; drop its code unless it was H/W.
+    codes = codes.where(letters.str[0].isin(["H", "W"]), codes.str[1:])
+    codes = codes.str.replace("0", "", regex=False)
+    return letters.str[0] + codes.str.pad(3, side="right", fillchar="0").str[:3]
+
+def _name_variants(names):
+    """One row per (record position, last-name part): block key and text."""
+    names = pd.Series(names.to_numpy(), dtype=object).dropna()
+    tokens = (
+        names.str.replace(r"[^A-Z\- ]", "", regex=True)
+        .str.replace(r"(?:^|\s)[A-Z](?=\s|$)", " ", regex=True)
+        .str.split()
+    )
+    tokens = tokens[tokens.str.len() >= 2]
+    out = pd.DataFrame(
+        {
+            "pos": tokens.index.to_numpy(),
+            "first": tokens.str[0].to_numpy(),
+            "last": tokens.str[-1].str.split("-").to_numpy(),
+        }
+    ).explode("last")
+    out = out[out["last"].str.len() > 0]
+    out["block"] = soundex(out["last"]) + out["first"].str[:2]
+    out["text"] = out["first"] + " " + out["last"]
+    return out.drop(columns=["first", "last"]).reset_index(drop=True)
+
+def _bigrams(text, pad):
+    raw = np.array(text.to_numpy(), dtype=f"S{_NAME_WIDTH}")
+    chars = _NAME_CHARS[raw.view(np.uint8).reshape(len(raw), _NAME_WIDTH)]
+    grams = chars[:, :-1] * 32 + chars[:, 1:]
+    grams[(chars[:, :-1] == 0) | (chars[:, 1:] == 0)] = pad
+    grams.sort(axis=1)
+    # Score sets of bigrams: blank out repeats within a name.
+    grams[:, 1:][grams[:, 1:] == grams[:, :-1]] = pad
+    return grams
+
+def dice_scores(a, b, chunk=100_000):
+    """Bigram Dice coefficient for aligned rows of two _bigrams arrays."""
+    scores = np.empty(len(a))
+    for i in range(0, len(a), chunk):
+        x, y = a[i : i + chunk], b[i : i + chunk]
+        common = (x[:, :, None] == y[:, None, :]).any(axis=2).sum(axis=1)
+        sizes = (x >= 0).sum(axis=1) + (y >= 0).sum(axis=1)
+        scores[i : i + chunk] = 2 * common / np.maximum(sizes, 1)
+    return scores
+
+def _split_blocks(leads, records, max_pairs):
+    """Extend the block key of blocks with over ``max_pairs`` name pairs."""
+    pairs = leads["block"].value_counts().mul(
+        records["block"].value_counts(), fill_value=0
+    )
+    big = pairs.index[pairs > max_pairs]
+    for names in (leads, records):
+        split = names["block"].isin(big)
+        names.loc[split, "block"] += names.loc[split, "text"].str[2:4]
+
+def fuzzy_name_match(
+    lead_names,
+    record_names,
+    threshold=FUZZY_THRESHOLD,
+    chunk=50_000,
+    max_block_pairs=FUZZY_BLOCK_MAX_PAIRS,
+):
+    """Best record position per lead name (-1 if none) and its score."""
+    leads = _name_variants(lead_names)
+    records = _name_variants(record_names)
+    records = records[records["block"].isin(leads["block"])]
+    # Identical names score the same: keep the first record per name, and
+    # score each distinct lead name once.
+    records = records.drop_duplicates(["block", "text"]).reset_index(drop=True)
+    texts = leads.drop_duplicates(["block", "text"]).drop(columns="pos")
+    _split_blocks(texts, records, max_block_pairs)
+    records = records.assign(row_r=np.arange(len(records)))
+    record_grams = _bigrams(records["text"], -2)
+    best = []
+    for i in range(0, len(texts), chunk):
+        part = texts.iloc[i : i + chunk]
+        part = part.assign(row_l=np.arange(len(part)))
+        pairs = part.merge(records, on="block", suffixes=("_l", "_r"))
+        if pairs.empty:
+            continue
+        pairs["score"] = dice_scores(
+            _bigrams(part["text"], -1)[pairs["row_l"].to_numpy()],
+            record_grams[pairs["row_r"].to_numpy()],
+        )
+        hits = pairs.loc[pairs["score"] >= threshold, ["text_l", "pos", "score"]]
+        hits = hits.rename(columns={"text_l": "text", "pos": "pos_r"})
+        best.append(
+            leads[["pos", "text"]]
+            .merge(hits, on="text")
+            .rename(columns={"pos": "pos_l"})
+            .drop(columns="text")
+        )
+    pos = np.full(len(lead_names), -1, dtype=np.int64)
+    score = np.zeros(len(lead_names))
+    if best:
+        best = (
+            pd.concat(best)
+            .sort_values("score", ascending=False, kind="stable")
+            .drop_duplicates("pos_l")
+        )
+        pos[best["pos_l"].to_numpy()] = best["pos_r"].to_numpy()
+        score[best["pos_l"].to_numpy()] = best["score"].to_numpy()
+    return pos, score
+
+# ── Sales Reduction ───────────────────────────────────────────────────────────
+# Joining policy-level sales on email is many-to-many for multi-policy
+# households, which duplicates lead rows (and their cost). Sales are collapsed
+# to one row per customer first; the policy-level frame stays available for
+# drill-down.
+def collapse_sales(sales, keys):
+    policy = sales["Policy #"].where(sales["Policy #"].notna(), "")
+    policy = policy.astype(str).str.strip()
+    df = keys.assign(
+        sale_key=keys["email"].fillna(keys["phone"]).fillna(keys["name_zip"]),
+        **{
+            "Policy #": policy.mask(policy.eq("")),
+            "Premium": sales["Premium"],
+            "Items": sales["Items"],
+            "Assigned To User": sales["Assigned To User"],
+        },
+    )
+    return (
+        df.dropna(subset=["sale_key"])
+        .groupby("sale_key", sort=False)
+        .agg(
+            email=("email", "first"),
+            phone=("phone", "first"),
+            name_zip=("name_zip", "first"),
+            name=("name", "first"),
+            Policies=("Policy #", "nunique"),
+            Premium=("Premium", "sum"),
+            Items=("Items", "sum"),
+            **{"Assigned To User": ("Assigned To User", "first")},
+        )
+        .reset_index()
+    )
+
+def merge_sales(df, sales, keys, fuzzy=False, engine=None):
+    """Attach per-customer sales to leads; returns (leads, matched policies).
+
+    With ``fuzzy`` leads the exact keys miss are matched by name similarity.
+    """
+    sale_keys = identity_keys(sales, engine)
+    collapsed = collapse_sales(sales, sale_keys)
+    pos, confidence = resolve_keys(collapsed, keys, engine)
+    if fuzzy:
+        todo = np.flatnonzero(pos < 0)
+        hit, score = fuzzy_name_match(
+            keys["name"].iloc[todo], collapsed["name"]
+        )
+        found = hit >= 0
+        pos[todo[found]] = hit[found]
+        confidence[todo[found]] = FUZZY_CONFIDENCE * score[found]
+    for col in ("Policies", "Premium", "Items"):
+        df[col] = _take(collapsed[col].to_numpy(), pos, 0)
+    df["Assigned To User"] = _take(
+        collapsed["Assigned To User"].to_numpy(), pos, None
+    )
+    df["sales_confidence"] = confidence
+    matched = collapsed["sale_key"].to_numpy()[np.unique(pos[pos >= 0])]
+    row_key = (
+        sale_keys["email"].fillna(sale_keys["phone"]).fillna(sale_keys["name_zip"])
+    )
+    return df, sales[row_key.isin(matched)]
+
+# ── Dispositions ──────────────────────────────────────────────────────────────
+# Disposition exports (full or delta) are folded into a DispoIndex that keeps
+# the latest milestone per email, phone and name+zip by activity timestamp.
+# A lead gets the newest milestone of all its keys that match; the best of
+# those keys only sets the match confidence.
+# With a path the index persists between sessions and every export is
+# applied once, so only new rows are ever mapped. Sessions sharing one index
+# apply and save under its lock, so no export is lost to a concurrent save.
+DISPO_TIME_HINTS = ("activity", "modified", "updated", "date")
+
+class DispoIndex:
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.applied = []
+        self.tables = {
+            kind: pd.DataFrame(
+                {
+                    "Milestone": pd.Series(dtype=object),
+                    "ts": pd.Series(dtype="datetime64[ns]"),
+                }
+            )
+            for kind in MATCH_KEYS
+        }
+        if path and os.path.exists(path):
+            saved = pd.read_parquet(path)
+            for kind in MATCH_KEYS:
+                self.tables[kind] = saved[saved["kind"] == kind].set_index(
+                    "key"
+                )[["Milestone", "ts"]]
+            with open(path + ".json") as fh:
+                self.applied = json.load(fh)
+
+    def apply(self, f, digest):
+        """Fold one export into the index; False if it was applied before."""
+        with self.lock:
+            return self._apply(f, digest)
+
+    def _apply(self, f, digest):
+        if digest in self.applied:
+            return False
+        dispo = pd.read_csv(f)
+        if "Folders" in dispo.columns:
+            dispo = dispo[~dispo["Folders"].astype(str).str.contains("!")]
+        if "Milestone" not in dispo.columns:
+            self.applied.append(digest)
+            return True
+        dispo = dispo.reset_index(drop=True)
+        schema = dict(resolve_schema("dispo", dispo.columns))
+        if "Phone" in dispo.columns:
+            schema["Phone"] = "Phone"
+        keys = identity_keys(
+            pd.DataFrame({k: dispo[c] for k, c in schema.items()})
+        )
+        # Rows without an activity time count as of when they are applied.
+        ts = pd.Series(pd.NaT, index=dispo.index, dtype="datetime64[ns]")
+        for hint in DISPO_TIME_HINTS:
+            cols = [c for c in dispo.columns if hint in c.lower()]
+            if cols:
+                # Zoned times ("...Z", "+02:00") are compared in UTC.
+                ts = pd.to_datetime(dispo[cols[0]], errors="coerce", utc=True)
+                ts = ts.dt.tz_localize(None).astype("datetime64[ns]")
+                break
+        rows = pd.DataFrame(
+            {
+                "Milestone": dispo["Milestone"].to_numpy(),
+                "ts": ts.fillna(pd.Timestamp.now()).to_numpy(),
+            }
+        )
+        # Tables and the applied list only change once the export has been
+        # folded in, so one that fails can be applied again.
+        tables = {}
+        for kind in MATCH_KEYS:
+            has_key = keys[kind].notna().to_numpy()
+            latest = (
+                rows[has_key]
+                .assign(key=keys[kind].to_numpy()[has_key])
+                .sort_values("ts", kind="stable")
+                .drop_duplicates("key", keep="last")
+                .set_index("key")
+            )
+            current = self.tables[kind]
+            newer = ~(current["ts"].reindex(latest.index) > latest["ts"])
+            wins = latest[newer.to_numpy()]
+            tables[kind] = pd.concat(
+                [current.drop(wins.index.intersection(current.index)), wins]
+            )
+        self.tables = tables
+        self.applied.append(digest)
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        pd.concat(
+            [
+                table.rename_axis("key").reset_index().assign(kind=kind)
+                for kind, table in self.tables.items()
+            ],
+            ignore_index=True,
+        ).to_parquet(self.path, index=False)
+        with open(self.path + ".json", "w") as fh:
+            json.dump(self.applied, fh)
+
+    def resolve(self, keys):
+        """Latest milestone per lead (None if unmatched) and confidence."""
+        with self.lock:
+            tables = dict(self.tables)
+        milestone = np.full(len(keys), None, dtype=object)
+        latest = np.full(len(keys), np.datetime64("NaT"), dtype="datetime64[ns]")
+        confidence = np.zeros(len(keys))
+        # Keys in priority order, so a tie in time goes to the better key.
+        for kind, score in MATCH_KEYS.items():
+            table = tables[kind]
+            pos = table.index.get_indexer(keys[kind].to_numpy())
+            hit = np.flatnonzero(pos >= 0)
+            ts = table["ts"].to_numpy()[pos[hit]]
+            newer = ~(latest[hit] >= ts)  # NaT: nothing matched yet
+            milestone[hit[newer]] = table["Milestone"].to_numpy()[pos[hit][newer]]
+            latest[hit[newer]] = ts[newer]
+            confidence[hit] = np.maximum(confidence[hit], score)
+        return milestone, confidence
+
+def merge_dispo(df, index, keys):
+    milestone, confidence = index.resolve(keys)
+    df["Milestone"] = pd.Series(milestone, index=df.index).fillna(df["Milestone"])
+    df["dispo_confidence"] = confidence
+    return df
+
+# ── Cost Allocation ───────────────────────────────────────────────────────────
+# Spend is applied after ingestion and the joins, so a new spend figure only
+# recomputes the cost column and the cube's Spend. Files with a per-lead cost
+# column keep it (EQ bills some files in cents). Vendors with a spend table
+# (invoice line items or a manual total) have it spread evenly over their
+# leads: by campaign and day where the line has both, falling back to the
+# campaign's month, the campaign, then the whole vendor when nothing matches.
+# A spend vendor also bills leads whose file vendor starts with it, as in
+# SmartFinancialAuto-2024.csv for SmartFinancial.
+COST_LEVELS = [
+    ["vendor", "campaign", "date"],
+    ["vendor", "campaign", "month"],
+    ["vendor", "campaign"],
+    ["vendor"],
+]
+
+def normalize_cost(cost):
+    cost = np.asarray(cost, dtype=np.float64)
+    return np.where(cost > 100, cost / 100, cost)
+
+def total_spend(vendor, amount):
+    """Spend table spreading one total over all of ``vendor``'s leads."""
+    return pd.DataFrame(
+        {
+            "vendor": [vendor],
+            "campaign": [None],
+            "date": [pd.NaT],
+            "amount": [amount],
+        }
+    )
+
+def _keys(frame, level):
+    if len(level) == 1:
+        return pd.Index(frame[level[0]])
+    return pd.MultiIndex.from_frame(frame[level])
+
+def allocate_cost(df, spend=None):
+    """Per-lead cost for ``df`` as a float32 array.
+
+    ``spend`` has vendor, campaign, date and amount columns; a missing
+    campaign or date spreads that amount wider.
+    """
+    cost = normalize_cost(df["source_cost"])
+    if spend is None or spend.empty:
+        return cost.astype(np.float32)
+    if "Created Date" in df.columns:
+        dates = pd.to_datetime(df["Created Date"], errors="coerce")
+    else:
+        dates = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    leads = pd.DataFrame(
+        {
+            "vendor": df["vendor"].astype(str).str.lower().to_numpy(),
+            "campaign": df["campaign"].astype(str).str.lower().to_numpy(),
+            "date": dates.dt.normalize().to_numpy(),
+        }
+    )
+    leads["month"] = leads["date"].dt.to_period("M")
+    todo = pd.DataFrame(
+        {
+            "vendor": spend["vendor"].astype(str).str.lower(),
+            "campaign": spend["campaign"].str.lower(),
+            "date": pd.to_datetime(spend["date"], errors="coerce").dt.normalize(),
+            "amount": pd.to_numeric(spend["amount"], errors="coerce"),
+        }
+    ).reset_index(drop=True)
+    todo["month"] = todo["date"].dt.to_period("M")
+    # Dated spend outside the loaded months belongs to leads not in df.
+    todo = todo[todo["month"].isna() | todo["month"].isin(leads["month"])]
+    prefixes = sorted(todo["vendor"].unique(), key=len)
+    leads["vendor"] = leads["vendor"].replace(
+        {
+            name: vendor
+            for vendor in prefixes  # longest prefix last, so it wins
+            for name in leads["vendor"].unique()
+            if name.startswith(vendor)
+        }
+    )
+    billed = leads["vendor"].isin(todo["vendor"]).to_numpy()
+    cost[billed] = 0.0
+    leads = leads[billed]
+    rows = np.flatnonzero(billed)
+    for level in COST_LEVELS:
+        usable = todo[level].notna().all(axis=1)
+        amounts = todo[usable].groupby(level)["amount"].sum()
+        counts = leads.groupby(level, observed=True, dropna=False).size()
+        per_lead = (amounts / counts.reindex(amounts.index)).dropna()
+        pos = per_lead.index.get_indexer(_keys(leads, level))
+        hit = pos >= 0
+        cost[rows[hit]] += per_lead.to_numpy()[pos[hit]]
+        # Lines with no leads at this level move down to the next one.
+        missed = usable & ~_keys(todo, level).isin(per_lead.index)
+        keep = ~usable | missed
+        todo = todo[keep].copy()
+        todo.loc[missed[keep], level[-1]] = None
+    return cost.astype(np.float32)
+
+# ── Compact Representation ────────────────────────────────────────────────────
+# Low-cardinality dimensions become categoricals, money becomes float32 and
+# flags stay boolean. Month is already an int32 key (see Period Index).
+CATEGORY_COLUMNS = [
+    "vendor",
+    "campaign",
+    "Milestone",
+    "Zip",
+    "Assigned To User",
+]
+MONEY_COLUMNS = ["cost", "source_cost", "Premium"]
+FLAG_COLUMNS = ["is_connected", "is_quoted"]
+
+def compact_leads(df):
+    """Shrink the merged leads frame in place; returns bytes before/after."""
+    before = int(df.memory_usage(deep=True).sum())
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col in MONEY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("float32")
+    for col in FLAG_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(bool)
+    return before, int(df.memory_usage(deep=True).sum())
+
+# ── Distinct Lead Sketches ────────────────────────────────────────────────────
+# Distinct emails don't add up across cube cells, so every cell keeps a
+# mergeable sketch of its email hashes: the exact sorted hash set, or
+# HyperLogLog registers (about 1.04 / sqrt(2 ** precision) relative error).
+# Most cells hold a handful of leads, so HyperLogLog registers are kept
+# sparse, as the (cell, register, rank) triples that are set, and merged by
+# taking the highest rank per (group, register) without a dense matrix.
+def email_hashes(emails):
+    return pd.util.hash_pandas_object(emails, index=False).to_numpy()
+
+def _bit_length(x):
+    # Exact for uint64: each 32-bit half converts to float64 losslessly.
+    hi = (x >> np.uint64(32)).astype(np.float64)
+    lo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(hi > 0, np.frexp(hi)[1] + 32, np.frexp(lo)[1])
+
+class EmailSketches:
+    def __init__(self, cells, emails, n_cells, mode="exact", precision=12):
+        self.mode = mode
+        self.precision = precision
+        keep = emails.notna().to_numpy()
+        cells = np.asarray(cells)[keep]
+        hashes = email_hashes(emails[keep])
+        if mode == "exact":
+            pairs = pd.DataFrame({"cell": cells, "hash": hashes})
+            pairs = pairs.drop_duplicates().sort_values(["cell", "hash"])
+            self.cells = pairs["cell"].to_numpy()
+            self.hashes = pairs["hash"].to_numpy()
+        else:
+            p = precision
+            idx = (hashes >> np.uint64(64 - p)).astype(np.int64)
+            rest = hashes << np.uint64(p)
+            rho = np.minimum(64 - _bit_length(rest) + 1, 64 - p + 1)
+            key, rho = _max_rank(cells.astype(np.int64) * 2**p + idx, rho)
+            self.cells = (key >> p).astype(np.int32)
+            self.registers = (key & (2**p - 1)).astype(np.uint16)
+            self.ranks = rho.astype(np.uint8)
+
+    def count(self, cells, groups, n_groups):
+        """Distinct emails per group, merging the sketches of ``cells``.
+
+        ``groups[i]`` is the group of ``cells[i]``; negative groups are
+        left out.
+        """
+        cells = np.asarray(cells)
+        groups = np.asarray(groups)
+        cell_group = np.full(
+            max(self.cells.max(initial=-1), cells.max(initial=-1)) + 1,
+            -1,
+            dtype=np.int64,
+        )
+        cell_group[cells] = groups
+        g = cell_group[self.cells]
+        keep = g >= 0
+        if self.mode == "exact":
+            pairs = pd.DataFrame({"g": g, "hash": self.hashes})[keep]
+            counts = pairs.drop_duplicates().groupby("g").size()
+            return counts.reindex(range(n_groups), fill_value=0).to_numpy()
+        m = 2**self.precision
+        key, rho = _max_rank(
+            g[keep] * m + self.registers[keep], self.ranks[keep]
+        )
+        g = key // m
+        # Registers never set are zeros, and add 2 ** -0 = 1 each.
+        nonzero = np.bincount(g, minlength=n_groups)
+        zeros = m - nonzero
+        total = zeros + np.bincount(g, np.exp2(-rho.astype(np.float64)), n_groups)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / total
+        small = (raw <= 2.5 * m) & (zeros > 0)
+        est = np.where(small, m * np.log(m / np.maximum(zeros, 1)), raw)
+        return np.rint(est).astype(np.int64)
+
+def _max_rank(key, rho):
+    """Unique ``key``s, sorted, each with its highest ``rho``."""
+    code = np.unique(key * 64 + rho)  # ranks are at most 64 - precision + 1
+    key = code // 64
+    last = np.r_[key[1:] != key[:-1], True]
+    return key[last], (code % 64)[last]
+
+# ── Metrics Cube ──────────────────────────────────────────────────────────────
+# One row per month × vendor × campaign × agent × zip with additive metrics,
+# built once per data load. Views, KPI cards and the Month filter roll it up
+# instead of re-scanning the lead rows.
+CUBE_DIMS = ["Month", "vendor", "campaign", "Assigned To User", "Zip"]
+CUBE_METRICS = [
+    "Premium",
+    "Spend",
+    "Connects",
+    "Quotes",
+    "Policies",
+    "Sold",
+    "Rows",
+]
+
+def build_cube(df, distinct="exact", precision=12, engine=None):
+    """Return the cube and the per-cell EmailSketches for Leads.
+
+    Each row's cube cell is written to ``df["cell"]`` for set_spend.
+    """
+    if _polars(engine):
+        return _polars(engine).build_cube(df, distinct, precision)
+    dims = [c for c in CUBE_DIMS if c in df.columns]
+    # Money is stored as float32 per lead but summed in float64, which
+    # float32 cannot do exactly beyond about $16M.
+    cells = pd.DataFrame(
+        {
+            "Premium": (
+                df["Premium"].astype(np.float64) if "Premium" in df.columns else 0.0
+            ),
+            "Spend": df["cost"].astype(np.float64),
+            "Connects": df["is_connected"],
+            "Quotes": df["is_quoted"],
+            "Policies": df["Policies"] if "Policies" in df.columns else 0,
+            "Sold": df["Policies"].gt(0) if "Policies" in df.columns else False,
+            "Rows": 1,
+        },
+        index=df.index,
+    )
+    cells[dims] = df[dims]
+    grouped = cells.groupby(dims, observed=True, dropna=False)
+    cube = grouped[CUBE_METRICS].sum().reset_index()
+    df["cell"] = grouped.ngroup().to_numpy(dtype=np.int32)
+    sketches = EmailSketches(
+        df["cell"].to_numpy(), df["email"], len(cube), distinct, precision
+    )
+    return cube, sketches
+
+def set_spend(cube, df):
+    """Refresh the cube's Spend from ``df["cost"]`` without regrouping."""
+    spend = np.bincount(
+        df["cell"].to_numpy(),
+        weights=df["cost"].to_numpy(dtype=np.float64),
+        minlength=len(cube),
+    )
+    # Full precision, as build_cube sums it: rounding each cell to cents
+    # would bias the roll-ups. Tables and cards round for display.
+    cube["Spend"] = spend
+
+def rollup(cube, by=None, sketches=None):
+    """Sum cube cells to ``by`` (indexed by it), or to a totals Series.
+
+    With ``sketches`` the result also gets a merged distinct-email Leads.
+    """
+    if not by:
+        out = cube[CUBE_METRICS].sum()
+        if sketches is not None:
+            out["Leads"] = sketches.count(
+                cube.index, np.zeros(len(cube), dtype=np.int64), 1
+            )[0]
+        return out
+    grouped = cube.groupby(by, observed=True)
+    out = grouped[CUBE_METRICS].sum()
+    if sketches is not None:
+        # Cells whose key is NaN are dropped by the groupby; ngroup marks
+        # them NaN.
+        groups = grouped.ngroup().fillna(-1).astype(np.int64).to_numpy()
+        out["Leads"] = sketches.count(cube.index, groups, len(out))
+    return out
+
+# ── Period Index ──────────────────────────────────────────────────────────────
+# build_dataset sorts leads by date and the cube is grouped Month-first, so a
+# period is one contiguous row range of either frame. PeriodRanges maps
+# sorted integer keys (day numbers for leads, YYYYMM months for the cube) to
+# row ranges, and frame.iloc[ranges.rows(lo, hi)] is a slice rather than a
+# boolean-mask copy.
+NO_DATE = np.iinfo(np.int32).max
+
+def day_keys(dates):
+    """Days since 1970-01-01 per date; NO_DATE (sorts last) if missing."""
+    days = pd.to_datetime(dates, errors="coerce").to_numpy("datetime64[D]")
+    return np.where(np.isnat(days), NO_DATE, days.astype(np.int64)).astype(
+        np.int32
+    )
+
+def day_key(date):
+    return int(np.datetime64(pd.Timestamp(date), "D").astype(np.int64))
+
+def month_keys(dates):
+    """YYYYMM per date; 0 if missing."""
+    dates = pd.to_datetime(dates, errors="coerce")
+    keys = dates.dt.year * 100 + dates.dt.month
+    return keys.fillna(0).to_numpy(dtype=np.int32)
+
+def month_label(key):
+    return f"{key // 100}-{key % 100:02d}" if key else "Unknown"
+
+def month_key(label):
+    """Inverse of month_label for "YYYY-MM"."""
+    year, month = label.split("-")
+    return int(year) * 100 + int(month)
+
+class PeriodRanges:
+    """Row range of each key in a frame sorted by that key."""
+
+    def __init__(self, keys):
+        keys = np.asarray(keys)
+        self.keys, self.starts = np.unique(keys, return_index=True)
+        self.stops = np.r_[self.starts[1:], len(keys)]
+
+    def rows(self, lo=None, hi=None):
+        """Slice of the rows with lo <= key <= hi."""
+        i = 0 if lo is None else np.searchsorted(self.keys, lo, "left")
+        j = len(self.keys) if hi is None else np.searchsorted(self.keys, hi, "right")
+        if i >= j:
+            return slice(0, 0)
+        return slice(int(self.starts[i]), int(self.stops[j - 1]))
+
+# ── Dataset & Views ───────────────────────────────────────────────────────────
+# The parse → merge → flag → aggregate pipeline shared by the dashboard and
+# lead_batch, and the tables each view shows.
+# Auto counts leads exactly unless the history is large. On synthetic leads
+# (0.8 cells per lead) the exact hash sets take about 1.7x the memory of the
+# sparse HyperLogLog registers, with views as fast or faster: 23 vs 13 MB at
+# 2M rows. Exact counting stays the default until that memory matters.
+EXACT_DISTINCT_MAX_ROWS = 10_000_000
+
+def build_dataset(
+    leads,
+    sales=None,
+    dispo_index=None,
+    distinct_mode="Auto",
+    fuzzy_names=False,
+    profile=None,
+    engine=None,
+):
+    """Join, flag and compact parsed leads and build their metrics cube.
+
+    Returns (leads, policies, cube, sketches, (bytes before, bytes after)).
+    Leads come back sorted by Created Date, for PeriodRanges. Cost is left
+    at zero for allocate_cost and set_spend. ``engine`` defaults to ENGINE.
+    """
+    engine = engine or ENGINE
+    if "Milestone" not in leads.columns:
+        leads["Milestone"] = None
+    leads = leads.rename(columns={"cost": "source_cost"})
+    leads["cost"] = 0.0
+    with profile_stage(profile, "identity keys", len(leads)) as rec:
+        keys = identity_keys(leads, engine)
+        rec["rows_out"] = len(keys)
+    if dispo_index is not None and dispo_index.applied:
+        with profile_stage(profile, "dispo merge", len(leads)) as rec:
+            leads = merge_dispo(leads, dispo_index, keys)
+            rec["rows_out"] = len(leads)
+    policies = None
+    if sales is not None:
+        with profile_stage(profile, "sales merge", len(leads)) as rec:
+            leads, policies = merge_sales(leads, sales, keys, fuzzy_names, engine)
+            rec["rows_out"] = len(leads)
+    # Flags & Month
+    with profile_stage(profile, "flags", len(leads)) as rec:
+        leads["is_connected"] = leads["Milestone"].isin(
+            ["Contacted", "Quoted", "Not interested", "Xdate", "Sold"]
+        )
+        leads["is_quoted"] = leads["Milestone"] == "Quoted"
+        if "Created Date" not in leads.columns:
+            leads["Created Date"] = pd.NaT
+        leads["Created Date"] = pd.to_datetime(
+            leads["Created Date"], errors="coerce"
+        )
+        rec["rows_out"] = len(leads)
+    with profile_stage(profile, "sort by date", len(leads)) as rec:
+        order = np.argsort(day_keys(leads["Created Date"]), kind="stable")
+        leads = leads.take(order).reset_index(drop=True)
+        leads["Month"] = month_keys(leads["Created Date"])
+        rec["rows_out"] = len(leads)
+    with profile_stage(profile, "compact", len(leads)) as rec:
+        mem = compact_leads(leads)
+        rec["rows_out"] = len(leads)
+    if distinct_mode == "Auto":
+        exact = len(leads) <= EXACT_DISTINCT_MAX_ROWS
+    else:
+        exact = distinct_mode == "Exact"
+    with profile_stage(profile, "cube", len(leads)) as rec:
+        cube, sketches = build_cube(leads, "exact" if exact else "hll", engine=engine)
+        rec["rows_out"] = len(cube)
+    return leads, policies, cube, sketches, mem
+
+VIEWS = {
+    "Campaign": (
+        ["vendor", "campaign"],
+        ["Premium", "Spend", "Leads", "Connects", "Quotes", "Policies"],
+        ["Connects", "Quotes", "Policies"],
+    ),
+    "Vendor": (
+        ["vendor"],
+        ["Premium", "Spend", "Leads", "Connects", "Quotes", "Policies"],
+        ["Connects", "Quotes", "Policies"],
+    ),
+    "Agent": (
+        ["Assigned To User"],
+        ["Leads", "Policies", "Connects", "Quotes"],
+        ["Connects", "Quotes"],
+    ),
+    "ZIP": (["Zip"], ["Leads", "Premium"], []),
+}
+
+def view_table(cube, sketches, view):
+    """Roll the cube up to one of VIEWS, with its rate columns."""
+    by, columns, rates = VIEWS[view]
+    out = rollup(cube, by, sketches).reset_index()[by + columns]
+    if "Spend" in out.columns:
+        out["Spend"] = out["Spend"].round(2)
+    for col in rates:
+        out[f"{col} Rate"] = (
+            out[col] / out["Leads"] * 100
+        ).round(1).astype(str) + "%"
+    return out
+
+# ── Shared Dataset Cache ──────────────────────────────────────────────────────
+# Streamlit gives every browser session its own session_state, so users
+# opening the same files would each build and hold a copy of the dataset.
+# One DatasetCache per process hands them the same data instead, through
+# read-only views: with pandas copy-on-write a session can still change
+# columns of its view (the dashboard's per-session cost) without the change
+# reaching anyone else, and arrays refuse writes.
+def nbytes(obj):
+    """Approximate memory held by frames and arrays in ``obj``."""
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        size = obj.memory_usage(deep=True)
+        return int(size.sum() if isinstance(obj, pd.DataFrame) else size)
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (tuple, list)):
+        return sum(map(nbytes, obj))
+    if isinstance(obj, dict):
+        return sum(map(nbytes, obj.values()))
+    if hasattr(obj, "__dict__"):
+        return nbytes(vars(obj))
+    return 0
+
+def read_only(obj):
+    """A view of the frames and arrays in ``obj`` that cannot change them:
+    frames are shallow copy-on-write copies, arrays non-writeable views."""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return obj.copy(deep=False)
+    if isinstance(obj, np.ndarray):
+        view = obj.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(obj, (tuple, list)):
+        return type(obj)(map(read_only, obj))
+    if isinstance(obj, dict):
+        return {k: read_only(v) for k, v in obj.items()}
+    if hasattr(obj, "__dict__"):
+        view = copy.copy(obj)
+        vars(view).update(read_only(vars(obj)))
+        return view
+    return obj
+
+class DatasetLease:
+    """A session's reference to a cached value; released when dropped."""
+
+    def __init__(self, cache, key, value):
+        self.key = key
+        self.value = value
+        self._release = weakref.finalize(self, cache._release, key)
+
+    def release(self):
+        self._release()
+
+class DatasetCache:
+    """Reference-counted values shared across sessions, by key.
+
+    Values over ``max_bytes`` in total are spilled to ``spill_dir`` (or
+    dropped without one) least recently used first, once no lease holds
+    them, and read back from disk on the next acquire. Values still leased
+    are never evicted, so the budget can be exceeded while they are in use.
+    Each lease holds a read_only view, so no session can change the value
+    another one sees.
+    """
+
+    def __init__(self, max_bytes, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.nbytes = 0
+        self._entries = OrderedDict()  # key -> [value, size, leases]
+        self._spilled = {}
+        self._building = {}
+        # Reentrant: a lease can be garbage collected, and so released,
+        # while this thread holds the lock.
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def acquire(self, key, build):
+        """Lease the value for ``key``, calling ``build()`` if it is neither in
+        memory nor on disk. Sessions asking for a key that is being built
+        wait for that build instead of starting their own."""
+        with self._lock:
+            building = self._building.setdefault(key, threading.Lock())
+        try:
+            with building:
+                # The lease is taken together with the lookup, so the entry
+                # cannot be evicted before it is returned.
+                with self._lock:
+                    entry = self._entries.get(key)
+                    path = self._spilled.pop(key, None)
+                    if entry is not None:
+                        entry[2] += 1
+                if entry is None:
+                    if path is not None:
+                        with open(path, "rb") as fh:
+                            value = pickle.load(fh)
+                        os.remove(path)
+                    else:
+                        value = build()
+                    entry = [value, nbytes(value), 1]
+                    with self._lock:
+                        self._entries[key] = entry
+                        self.nbytes += entry[1]
+        finally:
+            # Also when build() raises, so a failed key is not kept forever.
+            with self._lock:
+                self._building.pop(key, None)
+        with self._lock:
+            self._entries.move_to_end(key)
+            self.evict()
+        return DatasetLease(self, key, read_only(entry[0]))
+
+    def _release(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries[key][2] -= 1
+                self.evict()
+
+    def evict(self):
+        """Spill unleased values until within budget; call with the lock."""
+        for key in list(self._entries):
+            if self.nbytes <= self.max_bytes:
+                break
+            if key not in self._entries:
+                continue
+            value, size, leases = self._entries[key]
+            if leases > 0:
+                continue
+            if self.spill_dir:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                name = hashlib.sha256(repr(key).encode()).hexdigest()
+                path = os.path.join(self.spill_dir, f"{name}.pkl")
+                with open(path, "wb") as fh:
+                    pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+                self._spilled[key] = path
+            del self._entries[key]
+            self.nbytes -= size
+
+# ── ZIP Rollups ───────────────────────────────────────────────────────────────
+# National vendors reach tens of thousands of ZIPs, too many bars to chart.
+# The ZIP view is rolled up on the server to 5-digit ZIPs, 3-digit prefixes or
+# states, and keeps the top N groups by Premium plus one "Other" group, so the
+# chart never gets more than N + 1 rows.
+ZIP_LEVELS = ["ZIP", "ZIP3", "State"]
+ZIP_TOP_N = 25
+ZIP_OTHER = "Other"
+# First ZIP3 of each USPS prefix range and its state; prefixes below the
+# first range or in an unassigned gap map to the range before them.
+_ZIP3_STATES = [
+    (5, "NY"), (6, "PR"), (8, "VI"), (9, "PR"), (10, "MA"), (28, "RI"),
+    (30, "NH"), (39, "ME"), (50, "VT"), (55, "MA"), (56, "VT"), (60, "CT"),
+    (70, "NJ"), (90, "AE"), (100, "NY"), (150, "PA"), (197, "DE"),
+    (200, "DC"), (201, "VA"), (202, "DC"), (206, "MD"), (220, "VA"),
+    (247, "WV"), (270, "NC"), (290, "SC"), (300, "GA"), (320, "FL"),
+    (340, "AA"), (341, "FL"), (350, "AL"), (370, "TN"), (386, "MS"),
+    (398, "GA"), (400, "KY"), (430, "OH"), (460, "IN"), (480, "MI"),
+    (500, "IA"), (530, "WI"), (550, "MN"), (569, "DC"), (570, "SD"),
+    (580, "ND"), (590, "MT"), (600, "IL"), (630, "MO"), (660, "KS"),
+    (680, "NE"), (700, "LA"), (716, "AR"), (730, "OK"), (733, "TX"),
+    (734, "OK"), (750, "TX"), (800, "CO"), (820, "WY"), (832, "ID"),
+    (840, "UT"), (850, "AZ"), (870, "NM"), (885, "TX"), (889, "NV"),
+    (900, "CA"), (962, "AP"), (967, "HI"), (969, "GU"), (970, "OR"),
+    (980, "WA"), (995, "AK"),
+]
+_ZIP3_STARTS = np.array([start for start, _ in _ZIP3_STATES])
+_ZIP3_STATE_NAMES = np.array([state for _, state in _ZIP3_STATES], dtype=object)
+
+def zip_level(zips, level):
+    """Each ZIP's ``level`` group as a categorical; computed per category."""
+    zips = pd.Series(zips).astype("category")
+    codes = zips.cat.codes.to_numpy()
+    labels = normalize_zip(pd.Series(zips.cat.categories.astype(str)))
+    if level == "ZIP3":
+        labels = labels.str[:3]
+    elif level == "State":
+        prefix = pd.to_numeric(labels.str[:3], errors="coerce")
+        pos = np.searchsorted(_ZIP3_STARTS, prefix.fillna(0), side="right") - 1
+        labels = pd.Series(
+            np.where(
+                prefix.notna() & (pos >= 0), _ZIP3_STATE_NAMES[pos.clip(0)], None
+            ),
+            dtype=object,
+        )
+    values = labels.to_numpy(dtype=object)
+    out = np.where(codes >= 0, values[codes.clip(0)], None)
+    return pd.Series(pd.Categorical(out), index=zips.index, name=level)
+
+def zip_table(cube, sketches, level="ZIP", top=ZIP_TOP_N):
+    """Leads and Premium for the ``top`` ``level`` groups by Premium and for
+    the rest as one ZIP_OTHER row; returns (table, number of groups in it)."""
+    groups = zip_level(cube["Zip"], level)
+    premium = cube["Premium"].groupby(groups, observed=True).sum()
+    ranked = premium.sort_values(ascending=False, kind="stable")
+    keep = ranked.index[:top]
+    bucket = groups.astype(object).where(groups.isin(keep) | groups.isna(), ZIP_OTHER)
+    out = rollup(
+        cube.assign(**{level: bucket}), [level], sketches
+    ).reset_index()[[level, "Leads", "Premium"]]
+    order = pd.Categorical(out[level], categories=[*keep, ZIP_OTHER], ordered=True)
+    out = out.iloc[np.argsort(order.codes, kind="stable")].reset_index(drop=True)
+    return out, len(ranked) - len(keep)
+
+def zip_cells(cube, level, label, shown):
+    """Cube cells in the zip_table row ``label``; ``shown`` are its rows."""
+    groups = zip_level(cube["Zip"], level)
+    if label == ZIP_OTHER:
+        match = groups.notna() & ~groups.isin(list(shown))
+    else:
+        match = groups == label
+    return cube.index.to_numpy()[match.to_numpy()]
+
+# ── Lead Drill-down ───────────────────────────────────────────────────────────
+# The leads behind a view row are found through the cube: a CellIndex lists
+# each cell's lead rows (one stable argsort of the rows' cells, laid out
+# contiguously per cell), so a row's leads are gathered from its cells
+# without scanning the frame. They are sorted once per selection; a page is
+# then a slice.
+DRILL_PAGE_ROWS = 100
+DRILL_COLUMNS = [
+    "Created Date",
+    "vendor",
+    "campaign",
+    "email",
+    "first_name",
+    "last_name",
+    "Phone",
+    "Zip",
+    "Milestone",
+    "Assigned To User",
+    "Policies",
+    "Premium",
+    "cost",
+]
+DRILL_SORTS = ["Created Date", "Premium", "Policies", "cost", "Milestone", "email"]
+
+class CellIndex:
+    """Lead rows per cube cell; ``base`` offsets rows of a cube built over a
+    slice of the leads."""
+
+    def __init__(self, cells, n_cells, base=0):
+        cells = np.asarray(cells)
+        self.order = np.argsort(cells, kind="stable") + base
+        self.starts = np.r_[0, np.cumsum(np.bincount(cells, minlength=n_cells))]
+
+    def rows(self, cells):
+        """Lead rows of ``cells`` in ascending order."""
+        cells = np.asarray(cells, dtype=np.int64)
+        lo, n = self.starts[cells], self.starts[cells + 1] - self.starts[cells]
+        pos = np.repeat(lo - (np.cumsum(n) - n), n) + np.arange(n.sum())
+        return np.sort(self.order[pos])
+
+def view_cells(cube, by, key):
+    """Cube cells in the view row whose ``by`` columns equal ``key``."""
+    match = np.ones(len(cube), dtype=bool)
+    for col, value in zip(by, key):
+        match &= (cube[col] == value).to_numpy()
+    return cube.index.to_numpy()[match]
+
+def sort_rows(leads, rows, by, descending=False):
+    """``rows`` ordered by the ``by`` column, missing values last."""
+    values = leads[by].iloc[rows].reset_index(drop=True)
+    order = values.sort_values(
+        ascending=not descending, na_position="last", kind="stable"
+    ).index
+    return rows[order.to_numpy()]
+
+def drill_page(leads, rows, page):
+    """Page ``page`` (from 0) of the sorted ``rows``, DRILL_COLUMNS only."""
+    start = page * DRILL_PAGE_ROWS
+    columns = [c for c in DRILL_COLUMNS if c in leads.columns]
+    return leads.iloc[rows[start : start + DRILL_PAGE_ROWS]][columns]
@@ -0,0 +1,275 @@
+"""Polars implementations of the pipeline's hot stages.
+
+Used by lead_pipeline when the engine is "polars". Each function takes and
+returns the same pandas objects as its lead_pipeline counterpart; the work in
+between runs on Arrow-backed Polars frames, whose CSV reader, string
+expressions, joins and group-bys use every core. Identity fields are
+normalized by expressions with the semantics of the lead_normalize kernels
+(tests/test_normalize.py runs the same cases through both), and created
+dates are still parsed by pandas.to_datetime, so both engines read the same
+values.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from lead_normalize import BLANKS
+from lead_pipeline import (
+    CUBE_DIMS,
+    CUBE_METRICS,
+    MATCH_KEYS,
+    EmailSketches,
+    resolve_schema,
+)
+
+# pandas.read_csv's default missing-value markers, so both engines agree on
+# which cells are empty.
+NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a",
+    "nan", "null",
+]
+
+# ── Normalization ─────────────────────────────────────────────────────────────
+# Each function takes and returns a Polars string expression; see the kernel
+# of the same name in lead_normalize for the rules. Polars does not share
+# subexpressions between when/then branches, so each is one chain of string
+# operations rather than masks over an intermediate column.
+def clean_email(e):
+    return e.str.to_lowercase().str.strip_chars().replace(BLANKS, None)
+
+def email_key(e):
+    email = clean_email(e)
+    local = (
+        email.str.extract(r"(?s)^(.*)@(?:g|google)mail\.com$")
+        .str.replace(r"(?s)\+.*", "")
+        .str.replace_all(".", "", literal=True)
+    )
+    # An empty local part ("+tag@gmail.com") comes out as "" and then null.
+    folded = (local + "@gmail.com").replace("@gmail.com", "")
+    return pl.coalesce(folded, email).replace("", None)
+
+def normalize_phone(e):
+    return (
+        e.str.strip_chars()
+        .str.replace(r"\.0$", "")
+        .str.replace(r"(?s)[A-Za-z#].*", "")
+        # Only a leading "+" counts; mark it with a letter the cut above
+        # has already removed from the rest of the value.
+        .str.replace(r"^\+", "P")
+        .str.replace_all(r"[^0-9P]", "")
+        # NANP: 10 digits, or 11 with a leading 1 ("+" or not). E.164: "+"
+        # and 8-15 digits with another country code. Anything else is missing.
+        .str.replace(r"^P?1(\d{10})$", "$1")
+        .str.extract(r"^(\d{10}|P[02-9]\d{7,14})$")
+        .str.replace("P", "+", literal=True)
+    )
+
+def normalize_name(e):
+    return (
+        e.str.to_uppercase()
+        .str.replace_all(r"[ \t\n\r\x0b\x0c]+", " ")
+        .str.strip_chars()
+        .replace(BLANKS, None)
+    )
+
+def normalize_zip(e):
+    return (
+        e.str.replace(r"(?s)\..*", "")
+        .str.replace_all(r"[^0-9]", "")
+        .str.slice(0, 5)
+        .replace("", None)
+        .str.pad_start(5, "0")
+    )
+
+# ── Parsing ───────────────────────────────────────────────────────────────────
+def parse_lead_file(f):
+    basename = f.name.rsplit(".", 1)[0]
+    for sep in ("_", "-", " "):
+        if sep in basename:
+            vendor, campaign = basename.split(sep, 1)
+            break
+    else:
+        return None
+    data = f.getvalue() if hasattr(f, "getvalue") else f.read()
+    try:
+        header = pd.read_csv(io.BytesIO(data), nrows=0).columns
+        schema = resolve_schema(vendor, header)
+        src = pl.read_csv(
+            io.BytesIO(data),
+            columns=sorted(set(schema.values())) or list(header[:1]),
+            infer_schema=False,
+            null_values=NA_VALUES,
+        )
+    except:
+        return None
+    none = pl.lit(None, pl.String)
+    col = lambda field: pl.col(schema[field]) if field in schema else none
+    df = src.select(
+        pl.lit(vendor).alias("vendor"),
+        pl.lit(campaign).alias("campaign"),
+        (clean_email(col("email")) if "email" in schema else none).alias("email"),
+        col("first_name").alias("first_name"),
+        col("last_name").alias("last_name"),
+        (
+            col("cost").cast(pl.Float64, strict=False).fill_null(0.0)
+            if "cost" in schema
+            else pl.lit(0.0)
+        ).alias("cost"),
+        (
+            normalize_phone(col("Phone")) if "Phone" in schema else none
+        ).alias("Phone"),
+        *([col("Zip").alias("Zip")] if "Zip" in schema else []),
+    ).to_pandas()
+    if "Created Date" in schema:
+        df.insert(
+            df.columns.get_loc("Phone") + 1,
+            "Created Date",
+            pd.to_datetime(
+                src.get_column(schema["Created Date"]).to_pandas(), errors="coerce"
+            ),
+        )
+    return df
+
+# ── Identity Keys ─────────────────────────────────────────────────────────────
+def _strings(s):
+    """Column as a Polars string Series, without copying text columns."""
+    if s.dtype == object or not pd.api.types.is_string_dtype(s.dtype):
+        s = s.astype(str).where(s.notna())
+    return pl.from_pandas(s).cast(pl.String)
+
+def identity_keys(df):
+    """lead_pipeline.identity_keys with the normalization done by Polars."""
+    cols = [
+        c
+        for c in ("email", "Phone", "Customer", "first_name", "last_name", "Zip")
+        if c in df.columns
+    ]
+    src = pl.DataFrame([_strings(df[c]).alias(c) for c in cols], height=len(df))
+    none = pl.lit(None, pl.String)
+    if "Customer" in cols and df["Customer"].notna().any():
+        name = normalize_name(pl.col("Customer"))
+    elif "first_name" in cols and "last_name" in cols:
+        name = pl.concat_str(
+            [normalize_name(pl.col("first_name")), normalize_name(pl.col("last_name"))],
+            separator=" ",
+        )
+    else:
+        name = none
+    zip_code = normalize_zip(pl.col("Zip")) if "Zip" in cols else none
+    keys = src.select(
+        (email_key(pl.col("email")) if "email" in cols else none).alias("email"),
+        (normalize_phone(pl.col("Phone")) if "Phone" in cols else none).alias(
+            "phone"
+        ),
+        pl.concat_str([name, zip_code], separator="|").alias("name_zip"),
+        name.alias("name"),
+    )
+    return pd.DataFrame(
+        {c: pd.array(keys.get_column(c).to_arrow(), dtype="str") for c in keys.columns},
+        index=df.index,
+    )
+
+# ── Key Joins ─────────────────────────────────────────────────────────────────
+def resolve(records, keys):
+    """IdentityIndex(records).resolve(keys) as one hash join per key."""
+    pos = np.full(len(keys), -1, dtype=np.int64)
+    confidence = np.zeros(len(keys))
+    for key, score in MATCH_KEYS.items():
+        todo = np.flatnonzero(pos < 0)
+        if not len(todo):
+            break
+        index = (
+            pl.DataFrame([_strings(records[key]).alias("k")])
+            .with_row_index("pos")
+            .drop_nulls("k")
+            .unique("k", keep="first", maintain_order=True)
+        )
+        if not len(index):
+            continue
+        probe = pl.DataFrame(
+            [
+                pl.Series("row", todo),
+                _strings(keys[key].iloc[todo]).alias("k"),
+            ]
+        )
+        hit = probe.join(index, on="k", how="inner")
+        rows = hit["row"].to_numpy()
+        pos[rows] = hit["pos"].to_numpy()
+        confidence[rows] = score
+    return pos, confidence
+
+# ── Metrics Cube ──────────────────────────────────────────────────────────────
+def _codes(s):
+    """Sorted integer codes (-1 for missing) and a decoder back to ``s``'s type."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s.cat.codes.to_numpy(), lambda c: pd.Categorical.from_codes(
+            c, dtype=s.dtype
+        )
+    codes, uniques = pd.factorize(s, sort=True)
+    return codes, lambda c: uniques.take(c, allow_fill=True)
+
+def build_cube(df, distinct="exact", precision=12):
+    """lead_pipeline.build_cube with the grouping done by Polars.
+
+    The dimensions' sorted codes are packed into one integer key (missing
+    values last), so a cell's rank in that key is its pandas group number
+    and cells come out in the same order.
+    """
+    dims = [c for c in CUBE_DIMS if c in df.columns]
+    n = len(df)
+    key = np.zeros(n, dtype=np.int64)
+    radix = []
+    decoders = {}
+    for d in dims:
+        codes, decoders[d] = _codes(df[d])
+        size = int(codes.max(initial=-1)) + 2
+        key = key * size + np.where(codes < 0, size - 1, codes)
+        radix.append(size)
+    src = pl.DataFrame(
+        {
+            "key": key,
+            # float64 sums for the float32 money columns, as in pandas.
+            "Premium": (
+                df["Premium"].to_numpy(dtype=np.float64)
+                if "Premium" in df.columns
+                else np.zeros(n)
+            ),
+            "Spend": df["cost"].to_numpy(dtype=np.float64),
+            "Connects": df["is_connected"].to_numpy(),
+            "Quotes": df["is_quoted"].to_numpy(),
+            "Policies": (
+                df["Policies"].to_numpy() if "Policies" in df.columns else np.zeros(n, np.int64)
+            ),
+        }
+    ).with_columns(cell=pl.col("key").rank("dense").cast(pl.Int32) - 1)
+    cells = (
+        src.lazy()
+        .group_by("cell")
+        .agg(
+            pl.col("key").first(),
+            pl.col("Premium").sum(),
+            pl.col("Spend").sum(),
+            pl.col("Connects").sum().cast(pl.Int64),
+            pl.col("Quotes").sum().cast(pl.Int64),
+            pl.col("Policies").sum().cast(pl.Int64),
+            (pl.col("Policies") > 0).sum().cast(pl.Int64).alias("Sold"),
+            pl.len().cast(pl.Int64).alias("Rows"),
+        )
+        .sort("cell")
+        .collect()
+    )
+    rest = cells["key"].to_numpy()
+    codes = {}
+    for d, size in zip(reversed(dims), reversed(radix)):
+        rest, code = np.divmod(rest, size)
+        codes[d] = np.where(code == size - 1, -1, code)
+    cube = pd.DataFrame({d: decoders[d](codes[d]) for d in dims})
+    for m in CUBE_METRICS:
+        cube[m] = cells[m].to_numpy()
+    cell = src["cell"].to_numpy()
+    df["cell"] = cell
+    sketches = EmailSketches(cell, df["email"], len(cube), distinct, precision)
+    return cube, sketches
@@ -0,0 +1,93 @@
+import glob
+import os
+
+import duckdb
+
+# ── SQL Over Lead History ─────────────────────────────────────────────────────
+# Ad-hoc questions go to an in-process DuckDB connection with one view per
+# data set. The Parquet views are read at query time: filters on vendor and
+# month prune store partitions, other filters skip row groups by their
+# statistics, and only the columns a query names are read. Anything that
+# does not fit in memory_limit spills to temp_directory, so the history can
+# be larger than RAM. Once the views exist the connection can only read the
+# store and spill to its temp directory (no other files, network, extension
+# installs or settings changes), and query runs read-only statements.
+#
+#   leads         the dataset currently loaded: merged, flagged, Month as YYYYMM
+#   lead_history  every lead appended to the store, partitioned by vendor/month
+#   dispositions  the persisted disposition index: key, kind, Milestone, ts
+#   sales         the sales workbook currently loaded
+SQL_MAX_ROWS = 10_000
+EXAMPLE_QUERY = """\
+SELECT Zip, "Assigned To User" AS agent, count(*) AS leads,
+       avg(is_quoted::INT) AS quote_rate
+FROM leads
+WHERE vendor = 'EQ' AND campaign = 'Tier2' AND Month BETWEEN 202407 AND 202409
+GROUP BY ALL
+ORDER BY leads DESC"""
+
+READ_STATEMENTS = (duckdb.StatementType.SELECT, duckdb.StatementType.EXPLAIN)
+
+def _literal(s):
+    return "'" + s.replace("'", "''") + "'"
+
+def _view(con, name, pattern, options=""):
+    if glob.glob(pattern):
+        con.execute(
+            f"CREATE OR REPLACE VIEW {name} AS "
+            f"SELECT * FROM read_parquet({_literal(pattern)}{options})"
+        )
+
+def _dir(path):
+    return os.path.join(os.path.abspath(path), "")
+
+def connect(
+    store_dir=None, cache_dir=None, leads=None, memory_limit=None, sales=None
+):
+    """Locked-down DuckDB connection with the views above that have data."""
+    con = duckdb.connect()
+    allowed = []
+    if memory_limit:
+        con.execute(f"SET memory_limit = {_literal(memory_limit)}")
+    if cache_dir:
+        temp_dir = os.path.join(cache_dir, "duckdb")
+        con.execute(f"SET temp_directory = {_literal(temp_dir)}")
+        allowed.append(_dir(temp_dir))
+    if leads is not None:
+        con.register("leads", leads)
+    if sales is not None:
+        con.register("sales", sales)
+    if store_dir:
+        _view(
+            con,
+            "lead_history",
+            os.path.join(store_dir, "*", "*", "*.parquet"),
+            ", hive_partitioning = true",
+        )
+        _view(con, "dispositions", os.path.join(store_dir, "dispositions.parquet"))
+        allowed.append(_dir(store_dir))
+    con.execute("SET allowed_directories = ?", [allowed])
+    con.execute("SET enable_external_access = false")
+    con.execute("SET lock_configuration = true")
+    return con
+
+def tables(con):
+    return [
+        name
+        for (name,) in con.execute(
+            "SELECT table_name FROM information_schema.tables ORDER BY table_name"
+        ).fetchall()
+    ]
+
+def query(con, sql, max_rows=SQL_MAX_ROWS):
+    """Return (frame of at most ``max_rows`` rows, whether rows were cut)."""
+    for statement in con.extract_statements(sql):
+        if statement.type not in READ_STATEMENTS:
+            raise ValueError(
+                f"only SELECT queries can be run, not {statement.type.name}"
+            )
+    rel = con.sql(sql)
+    if rel is None:  # nothing but comments
+        return None, False
+    df = rel.limit(max_rows + 1).df()
+    return df.iloc[:max_rows], len(df) > max_rows
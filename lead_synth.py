@@ -0,0 +1,268 @@
+"""Reproducible synthetic lead, sales and disposition exports.
+
+    python lead_synth.py --rows 1000000 --out synth/ --seed 0
+
+Writes one CSV per vendor campaign in that vendor's own column layout
+(<Vendor>_<Campaign>.csv), a sales workbook and a full plus a delta
+disposition export under dispo/. Leads are drawn from a shared pool of
+people so the same household shows up across vendors, in sales
+(sometimes without an email) and in the disposition exports.
+"""
+import argparse
+import os
+import string
+import sys
+
+import numpy as np
+import pandas as pd
+
+VENDOR_LAYOUTS = {
+    # vendor: (campaigns, {field: column}, phone format, date format)
+    "EQ": (
+        ["Tier1", "Tier2"],
+        {
+            "email": "email",
+            "first": "first_name",
+            "last": "last_name",
+            "phone": "phone",
+            "date": "created_date",
+            "zip": "zip",
+            "cost": "cost",
+        },
+        "({a}) {b}-{c}",
+        "%Y-%m-%d",
+    ),
+    "SmartFinancial": (
+        ["Auto", "Home"],
+        {
+            "email": "Email",
+            "first": "First Name",
+            "last": "Last Name",
+            "phone": "Phone Number",
+            "date": "Lead Created Date",
+            "zip": "Zip Code",
+        },
+        "{a}{b}{c}",
+        "%m/%d/%Y %H:%M",
+    ),
+    "QuoteWizard": (
+        ["Auto", "Bundle"],
+        {
+            "email": "Email Address",
+            "first": "First Name",
+            "last": "Last Name",
+            "phone": "Primary Phone",
+            "date": "Date Created",
+            "zip": "Zip",
+        },
+        "{a}-{b}-{c}",
+        "%Y-%m-%dT%H:%M:%S",
+    ),
+    "EverQuote": (
+        ["Auto", "Renters"],
+        {
+            "email": "email",
+            "first": "first",
+            "last": "last",
+            "phone": "phone_number",
+            "date": "lead_date",
+            "zip": "zip_code",
+        },
+        "+1{a}{b}{c}",
+        "%Y-%m-%d %H:%M:%S",
+    ),
+}
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael",
+    "Linda", "William", "Elizabeth", "David", "Barbara", "Richard", "Susan",
+    "Joseph", "Jessica", "Thomas", "Sarah", "Carlos", "Karen", "Daniel",
+    "Nancy", "Matthew", "Lisa", "Anthony", "Betty", "Mark", "Sandra",
+    "Wei", "Ashley", "Steven", "Kimberly", "Andrew", "Emily", "Jose",
+    "Donna", "Kevin", "Michelle", "Brian", "Carol", "Nguyen", "Amanda",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller",
+    "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez",
+    "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+    "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark",
+    "Ramirez", "Lewis", "Robinson", "Walker", "Young", "Allen", "King",
+    "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores", "Green",
+]
+DOMAINS = ["gmail.com", "yahoo.com", "hotmail.com", "outlook.com", "aol.com"]
+MILESTONES = ["New", "Contacted", "Quoted", "Not interested", "Xdate", "Sold"]
+AGENTS = [f"Agent {i:02d}" for i in range(1, 25)]
+EXCEL_MAX_ROWS = 1_000_000
+
+def people(n, rng, start="2024-01-01", days=365):
+    """One row per synthetic person: names, email, phone, zip, created."""
+    first = np.array(FIRST_NAMES)[rng.integers(len(FIRST_NAMES), size=n)]
+    last = np.array(LAST_NAMES)[rng.integers(len(LAST_NAMES), size=n)]
+    domain = np.array(DOMAINS)[rng.integers(len(DOMAINS), size=n)]
+    ids = pd.Series(np.arange(n)).astype(str)
+    email = (
+        pd.Series(first).str.lower()
+        + "."
+        + pd.Series(last).str.lower()
+        + ids
+        + "@"
+        + domain
+    )
+    # About one email in thirty is left blank so phone/name matching is used.
+    email[rng.random(n) < 0.03] = ""
+    created = pd.Timestamp(start) + pd.to_timedelta(
+        rng.integers(0, days * 86_400, size=n), unit="s"
+    )
+    return pd.DataFrame(
+        {
+            "first": first,
+            "last": last,
+            "email": email,
+            "phone": rng.integers(201_200_0000, 989_999_9999, size=n),
+            "zip": rng.integers(1_001, 99_950, size=n // 30 + 1)[
+                rng.integers(n // 30 + 1, size=n)
+            ],
+            "created": created,
+        }
+    )
+
+def format_phone(phone, fmt):
+    """Vendor phone formatting of 10-digit numbers, e.g. "({a}) {b}-{c}"."""
+    digits = pd.Series(phone).astype(str)
+    parts = {"a": digits.str[:3], "b": digits.str[3:6], "c": digits.str[6:]}
+    out = pd.Series("", index=digits.index)
+    for literal, field, _, _ in string.Formatter().parse(fmt):
+        out = out + literal
+        if field:
+            out = out + parts[field]
+    return out
+
+def lead_files(pool, rows, rng):
+    """{file name: frame} splitting ``rows`` leads across vendor campaigns."""
+    files = [
+        (vendor, campaign)
+        for vendor, (campaigns, *_) in VENDOR_LAYOUTS.items()
+        for campaign in campaigns
+    ]
+    owner = rng.integers(len(files), size=rows)
+    who = rng.integers(len(pool), size=rows)
+    out = {}
+    for i, (vendor, campaign) in enumerate(files):
+        _, columns, phone_fmt, date_fmt = VENDOR_LAYOUTS[vendor]
+        p = pool.iloc[who[owner == i]].reset_index(drop=True)
+        df = pd.DataFrame(
+            {
+                columns["email"]: p["email"],
+                columns["first"]: p["first"],
+                columns["last"]: p["last"],
+                columns["phone"]: format_phone(p["phone"], phone_fmt),
+                columns["date"]: p["created"].dt.strftime(date_fmt),
+                columns["zip"]: p["zip"].astype(str).str.zfill(5),
+                "lead_id": rng.integers(10**9, 10**10, size=len(p)),
+                "source_url": f"https://{vendor.lower()}.example/{campaign}",
+            }
+        )
+        if "cost" in columns:
+            # EQ bills some files in cents and some in dollars.
+            cost = rng.choice([8.0, 12.5, 15.0, 22.0], size=len(p))
+            df[columns["cost"]] = cost * 100 if campaign == "Tier1" else cost
+        out[f"{vendor}_{campaign}.csv"] = df
+    return out, pool.iloc[np.unique(who)]
+
+def sales_frame(leads, rng, rate=0.08):
+    """Policies sold to a share of ``leads``: 1-3 rows per household."""
+    sold = leads.sample(frac=rate, random_state=rng.integers(2**31))
+    n = rng.integers(1, 4, size=len(sold))
+    s = sold.loc[sold.index.repeat(n)].reset_index(drop=True)
+    # A tenth of households were sold without an email on file.
+    no_email = np.repeat(rng.random(len(sold)) < 0.1, n)
+    return pd.DataFrame(
+        {
+            "Customer Email": s["email"].mask(no_email, ""),
+            "Policy #": [f"P{i:08d}" for i in range(len(s))],
+            "Premium": rng.integers(300, 3_000, size=len(s)),
+            "Items": rng.integers(1, 4, size=len(s)),
+            "Assigned To User": np.repeat(
+                np.array(AGENTS)[rng.integers(len(AGENTS), size=len(sold))], n
+            ),
+            "Phone": s["phone"],
+            "First Name": s["first"],
+            "Last Name": s["last"],
+            "Customer": (s["first"] + " " + s["last"]).str.upper(),
+            "Zip": s["zip"].astype(str).str.zfill(5),
+        }
+    )
+
+def dispo_frame(leads, rng, frac, start):
+    """A disposition export covering ``frac`` of ``leads``."""
+    d = leads.sample(frac=frac, random_state=rng.integers(2**31))
+    activity = pd.Timestamp(start) + pd.to_timedelta(
+        rng.integers(0, 30 * 86_400, size=len(d)), unit="s"
+    )
+    return pd.DataFrame(
+        {
+            "Primary Email Address": d["email"].to_numpy(),
+            "First Name": d["first"].to_numpy(),
+            "Last Name": d["last"].to_numpy(),
+            "Phone": format_phone(d["phone"].to_numpy(), "({a}) {b}-{c}"),
+            "Milestone": np.array(MILESTONES)[
+                rng.integers(len(MILESTONES), size=len(d))
+            ],
+            "Folders": np.where(rng.random(len(d)) < 0.05, "Dead!", "Active"),
+            "Last Activity Date": activity.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    )
+
+def write_sales(sales, path):
+    """Write CSV, or an xlsx split into sheets of at most EXCEL_MAX_ROWS."""
+    if path.endswith(".csv"):
+        sales.to_csv(path, index=False)
+        return
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame(
+            {"Policies": [len(sales)], "Premium": [sales["Premium"].sum()]}
+        ).to_excel(writer, sheet_name="Summary", index=False)
+        for i, start in enumerate(range(0, len(sales), EXCEL_MAX_ROWS)):
+            sales.iloc[start : start + EXCEL_MAX_ROWS].to_excel(
+                writer, sheet_name=f"Sales {i + 1}", index=False
+            )
+
+def generate(out_dir, rows=100_000, seed=0, sales_format="xlsx"):
+    """Write a synthetic data set to ``out_dir``; returns the paths."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    pool = people(max(rows * 3 // 4, 1), rng)
+    files, leads = lead_files(pool, rows, rng)
+    paths = {"leads": [], "sales": None, "dispo": []}
+    for name, df in files.items():
+        path = os.path.join(out_dir, name)
+        df.to_csv(path, index=False)
+        paths["leads"].append(path)
+    paths["sales"] = os.path.join(out_dir, f"sales.{sales_format}")
+    write_sales(sales_frame(leads, rng), paths["sales"])
+    # Kept out of the lead directory so ``lead_batch --leads <out>`` does
+    # not pick them up as another vendor.
+    dispo_dir = os.path.join(out_dir, "dispo")
+    os.makedirs(dispo_dir, exist_ok=True)
+    for name, frac, start in (
+        ("dispo_full.csv", 0.6, "2025-01-01"),
+        ("dispo_delta.csv", 0.1, "2025-02-01"),
+    ):
+        path = os.path.join(dispo_dir, name)
+        dispo_frame(leads, rng, frac, start).to_csv(path, index=False)
+        paths["dispo"].append(path)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sales-format", choices=["xlsx", "csv"], default="xlsx")
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args(argv)
+    paths = generate(args.out, args.rows, args.seed, args.sales_format)
+    for path in paths["leads"] + [paths["sales"]] + paths["dispo"]:
+        print(path)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""allocate_cost: spend spread by day, month, campaign, then vendor."""
+import numpy as np
+import pandas as pd
+
+from lead_pipeline import allocate_cost, total_spend
+
+def leads(rows):
+    return pd.DataFrame(
+        rows, columns=["vendor", "campaign", "Created Date", "source_cost"]
+    ).assign(**{"Created Date": lambda d: pd.to_datetime(d["Created Date"])})
+
+def spend(rows):
+    return pd.DataFrame(rows, columns=["vendor", "campaign", "date", "amount"])
+
+def test_fallback_order():
+    df = leads(
+        [
+            ("SmartFinancial", "Auto", "2024-03-01", 0.0),
+            ("SmartFinancial", "Auto", "2024-03-01", 0.0),
+            ("SmartFinancial", "Auto", "2024-03-05", 0.0),
+            ("SmartFinancial", "Home", "2024-04-02", 0.0),
+            ("EQ", "Tier1", "2024-03-01", 150.0),
+        ]
+    )
+    cost = allocate_cost(
+        df,
+        spend(
+            [
+                ("SmartFinancial", "Auto", "2024-03-01", 10.0),  # its day
+                ("SmartFinancial", "Auto", "2024-03-20", 6.0),  # no leads: month
+                ("SmartFinancial", "Home", "2024-03-15", 4.0),  # none: campaign
+                ("SmartFinancial", "Renters", "2024-04-01", 9.0),  # vendor
+                ("SmartFinancial", "Auto", "2023-12-01", 50.0),  # not loaded
+            ]
+        ),
+    )
+    # The EQ lead keeps its own cost (billed in cents).
+    np.testing.assert_allclose(cost, [9.25, 9.25, 4.25, 6.25, 1.5])
+
+def test_vendor_prefix():
+    df = leads(
+        [
+            ("SmartFinancialAuto", "2024", "2024-03-01", 0.0),
+            ("SmartFinancial", "Home", "2024-03-01", 0.0),
+            ("Smart", "Leads", "2024-03-01", 0.0),
+        ]
+    )
+    cost = allocate_cost(df, total_spend("SmartFinancial", 100.0))
+    np.testing.assert_allclose(cost, [50.0, 50.0, 0.0])
@@ -0,0 +1,70 @@
+"""DatasetCache: leases, spilling and reloading, read-only values."""
+import gc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lead_pipeline import DatasetCache, PeriodRanges
+
+def value(n=1000):
+    frame = pd.DataFrame({"x": np.arange(n)})
+    return frame, PeriodRanges(np.arange(n) // 10)
+
+def leases(cache):
+    return {key: entry[2] for key, entry in cache._entries.items()}
+
+def test_lease_counting():
+    cache = DatasetCache(10**9)
+    builds = []
+    build = lambda: builds.append(1) or value()
+    a = cache.acquire("k", build)
+    b = cache.acquire("k", build)
+    assert len(builds) == 1
+    assert leases(cache) == {"k": 2}
+    a.release()
+    assert leases(cache) == {"k": 1}
+    del b
+    gc.collect()
+    assert leases(cache) == {"k": 0}
+
+def test_spill_and_reload(tmp_path):
+    cache = DatasetCache(0, str(tmp_path))
+    builds = []
+    lease = cache.acquire("k", lambda: builds.append(1) or value())
+    assert len(cache) == 1  # leased values are never evicted
+    lease.release()
+    assert len(cache) == 0 and cache.nbytes == 0
+    assert len(list(tmp_path.iterdir())) == 1
+    lease = cache.acquire("k", lambda: builds.append(1) or value())
+    assert len(builds) == 1
+    assert not list(tmp_path.iterdir())
+    frame, ranges = lease.value
+    assert frame["x"].tolist() == list(range(1000))
+    assert ranges.rows(3, 4) == slice(30, 50)
+
+def test_drop_without_spill_dir():
+    cache = DatasetCache(0)
+    builds = []
+    cache.acquire("k", lambda: builds.append(1) or value()).release()
+    assert len(cache) == 0
+    cache.acquire("k", lambda: builds.append(1) or value())
+    assert len(builds) == 2
+
+def test_values_are_read_only():
+    cache = DatasetCache(10**9)
+    a = cache.acquire("k", value)
+    b = cache.acquire("k", value)
+    frame, ranges = a.value
+    frame["x"] = -1
+    frame["y"] = 1
+    frame.loc[0, "x"] = 5
+    ranges.keys = None
+    with pytest.raises(ValueError):
+        frame["x"].to_numpy()[0] = 7
+    with pytest.raises(ValueError):
+        b.value[1].starts[0] = 7
+    frame, ranges = b.value
+    assert frame.columns.tolist() == ["x"]
+    assert frame["x"].tolist() == list(range(1000))
+    assert ranges.keys is not None and ranges.starts[0] == 0
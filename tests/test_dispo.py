@@ -0,0 +1,69 @@
+"""DispoIndex: newest milestone across keys, zoned times, failed exports."""
+import io
+
+import pandas as pd
+import pytest
+
+import lead_pipeline
+from lead_pipeline import DispoIndex, identity_keys
+
+FULL = """Primary Email Address,Phone,Milestone,Last Activity Date
+a@x.com,5551234567,Contacted,2024-01-01
+b@x.com,5559876543,Quoted,2024-01-01
+"""
+DELTA = """Primary Email Address,Phone,Milestone,Last Activity Date
+,5551234567,Sold,2024-02-01
+b@x.com,,Contacted,2023-12-01
+"""
+
+def export(text):
+    return io.StringIO(text)
+
+def resolve(index, emails, phones):
+    keys = identity_keys(pd.DataFrame({"email": emails, "Phone": phones}))
+    return index.resolve(keys)
+
+def test_newest_milestone_across_keys():
+    index = DispoIndex()
+    index.apply(export(FULL), "full")
+    index.apply(export(DELTA), "delta")
+    milestone, confidence = resolve(
+        index,
+        ["a@x.com", "b@x.com", None, "c@x.com"],
+        ["5551234567", "5559876543", "5551234567", None],
+    )
+    # The phone's Sold is newer than the email's Contacted; for b the email
+    # row in the delta is older than the full export's.
+    assert milestone.tolist() == ["Sold", "Quoted", "Sold", None]
+    assert confidence.tolist() == [1.0, 1.0, 0.9, 0.0]
+
+def test_zoned_activity_times(tmp_path):
+    index = DispoIndex(str(tmp_path / "dispositions.parquet"))
+    index.apply(
+        export(
+            "Primary Email Address,Milestone,Last Activity Date\n"
+            "a@x.com,Quoted,2024-01-01T10:00:00Z\n"
+            "b@x.com,Quoted,2024-01-01T10:00:00+02:00\n"
+        ),
+        "zoned",
+    )
+    index.save()
+    ts = DispoIndex(index.path).tables["email"]["ts"]
+    assert ts.to_dict() == {
+        "a@x.com": pd.Timestamp("2024-01-01 10:00"),
+        "b@x.com": pd.Timestamp("2024-01-01 08:00"),
+    }
+
+def test_failed_export_is_not_recorded(monkeypatch):
+    index = DispoIndex()
+
+    def broken(df):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(lead_pipeline, "identity_keys", broken)
+    with pytest.raises(RuntimeError):
+        index.apply(export(FULL), "full")
+    assert index.applied == []
+    monkeypatch.undo()
+    assert index.apply(export(FULL), "full")
+    assert resolve(index, ["a@x.com"], [None])[0].tolist() == ["Contacted"]
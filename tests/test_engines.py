@@ -0,0 +1,41 @@
+"""Every engine gives the same view tables on the same synthetic exports."""
+import pandas as pd
+import pytest
+
+import lead_pipeline
+from lead_batch import run_pipeline
+from lead_synth import generate
+
+pytest.importorskip("polars")
+
+@pytest.fixture(scope="module")
+def paths(tmp_path_factory):
+    out = tmp_path_factory.mktemp("synth")
+    return generate(out, 5_000, seed=0, sales_format="csv")
+
+@pytest.mark.parametrize("workers", [1, None])
+def test_engines_agree(paths, workers):
+    tables = {
+        engine: run_pipeline(
+            paths["leads"],
+            paths["sales"],
+            paths["dispo"],
+            manual_spend=1e4,
+            workers=workers,
+            engine=engine,
+        )[0]
+        for engine in lead_pipeline.ENGINES
+    }
+    base, *others = lead_pipeline.ENGINES
+    assert set(tables[base]) == set(lead_pipeline.VIEWS)
+    for engine in others:
+        for view, table in tables[base].items():
+            pd.testing.assert_frame_equal(
+                table, tables[engine][view], obj=f"{engine} {view}"
+            )
+
+def test_engine_is_not_global(paths):
+    default = lead_pipeline.ENGINE
+    other = next(e for e in lead_pipeline.ENGINES if e != default)
+    run_pipeline(paths["leads"][:2], engine=other)
+    assert lead_pipeline.ENGINE == default
@@ -0,0 +1,45 @@
+"""fuzzy_name_match on the name variations it is meant to catch."""
+import numpy as np
+import pandas as pd
+
+from lead_normalize import normalize_name
+from lead_pipeline import fuzzy_name_match
+
+RECORDS = ["Katherine Johnson", "Ana Garcia", "Robert Smith", "Maria Lopez"]
+
+def match(leads, records=RECORDS, **kwargs):
+    pos, score = fuzzy_name_match(
+        normalize_name(pd.Series(leads)),
+        normalize_name(pd.Series(records)),
+        **kwargs,
+    )
+    return pos.tolist(), score
+
+def test_typo():
+    assert match(["Katherine Jonhson"])[0] == [0]
+
+def test_middle_initial():
+    pos, score = match(["Robert J. Smith", "Robert J Smith"])
+    assert pos == [2, 2]
+    np.testing.assert_allclose(score, 1.0)
+
+def test_hyphenated_surname():
+    assert match(["Ana Garcia-Lopez", "Maria Perez-Lopez"])[0] == [1, 3]
+
+def test_no_match():
+    assert match(["Robert Brown", "Zoe Smith", None, "Cher"])[0] == [-1] * 4
+
+def test_split_blocks_keep_matches():
+    # One Soundex block (S530 + "JO") too big to compare as a whole.
+    vowels = "AEIOU"
+    records = [
+        f"{first} SMITH{a}{b}{c}"
+        for first in ["JOHN", "JOHANNA", "JOSEPH", "JONAH"]
+        for a in vowels
+        for b in vowels
+        for c in vowels[:3]
+    ]
+    leads = [name.replace("SMITH", "SMYTH") for name in records]
+    whole = match(leads, records)
+    split = match(leads, records, max_block_pairs=10)
+    assert whole[0] == split[0] == list(range(len(records)))
@@ -0,0 +1,101 @@
+"""Identity-field normalization: the Arrow kernels and the Polars expressions."""
+import pandas as pd
+import pytest
+
+import lead_normalize
+
+CASES = {
+    "clean_email": [
+        (" John.Doe@Example.COM ", "john.doe@example.com"),
+        ("", None),
+        ("NaN", None),
+        ("null", None),
+        (None, None),
+    ],
+    "email_key": [
+        ("J.Doe+promo@GMail.com", "jdoe@gmail.com"),
+        ("j.doe@googlemail.com", "jdoe@gmail.com"),
+        ("+tag@gmail.com", None),
+        ("..@gmail.com", None),
+        ("j.doe+x@yahoo.com", "j.doe+x@yahoo.com"),
+        ("a.b@gmail.com.au", "a.b@gmail.com.au"),
+        (" none ", None),
+        (None, None),
+    ],
+    "normalize_phone": [
+        ("(555) 123-4567", "5551234567"),
+        ("+1 555 123 4567", "5551234567"),
+        ("1-555-123-4567", "5551234567"),
+        ("555-123-4567 x12", "5551234567"),
+        ("555.123.4567 ext. 12", "5551234567"),
+        ("555-123-4567#12", "5551234567"),
+        ("5551234567.0", "5551234567"),
+        ("15551234567.0", "5551234567"),
+        ("+44 20 7946 0958", "+442079460958"),
+        ("+1 555 0100", None),
+        ("25551234567", None),
+        ("+44 20", None),
+        ("123", None),
+        ("", None),
+        ("nan", None),
+        (None, None),
+    ],
+    "normalize_name": [
+        ("  mary   ann\tsmith ", "MARY ANN SMITH"),
+        ("o'brien", "O'BRIEN"),
+        ("", None),
+        ("none", None),
+        (None, None),
+    ],
+    "normalize_zip": [
+        ("12345", "12345"),
+        ("12345-6789", "12345"),
+        ("2134.0", "02134"),
+        ("02134", "02134"),
+        ("ZIP 90210", "90210"),
+        ("abc", None),
+        ("", None),
+        (None, None),
+    ],
+}
+
+def arrow(name, values):
+    out = getattr(lead_normalize, name)(pd.Series(values, dtype="str"))
+    return [None if pd.isna(v) else v for v in out]
+
+def polars(name, values):
+    pl = pytest.importorskip("polars")
+    import lead_polars
+
+    src = pl.DataFrame({"v": values}, schema={"v": pl.String})
+    return src.select(getattr(lead_polars, name)(pl.col("v"))).to_series().to_list()
+
+@pytest.mark.parametrize("run", [arrow, polars])
+@pytest.mark.parametrize("name", CASES)
+def test_cases(run, name):
+    values, expected = zip(*CASES[name])
+    assert run(name, list(values)) == list(expected)
+
+def test_non_text_columns():
+    zips = pd.Series([2134.0, 90210.0, None])
+    assert lead_normalize.normalize_zip(zips).tolist()[:2] == ["02134", "90210"]
+    phones = pd.Series([5551234567.0, None])
+    assert lead_normalize.normalize_phone(phones).tolist()[0] == "5551234567"
+
+def test_identity_keys_engines():
+    pytest.importorskip("polars")
+    from lead_pipeline import identity_keys
+
+    df = pd.DataFrame(
+        {
+            "email": ["A.B+x@gmail.com", None, "c@x.com", "+t@gmail.com"],
+            "Phone": ["555-123-4567 x9", "+44 20 7946 0958", None, "12"],
+            "first_name": ["ann", "bo", None, " cy "],
+            "last_name": ["lee", "li", "lo", "  "],
+            "Zip": ["02134-1", None, "90210", "1"],
+        },
+        index=[3, 1, 4, 1],
+    )
+    pd.testing.assert_frame_equal(
+        identity_keys(df, "pandas"), identity_keys(df, "polars"), check_dtype=False
+    )